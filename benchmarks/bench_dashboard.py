@@ -0,0 +1,240 @@
+"""Headless benchmarks of the dashboard classes on synthetic HCP-sized data.
+
+For every scale (a multiple of the HCP Young Adult behavioural table size),
+the benchmark uploads a synthetic behavioural CSV through FileLoader, then
+drives BehavPlot, DemPlot, TractPlot and App through typical interactions.
+Timings come from the dashboard's own profiler (see content/profiling.py).
+Widgets are created without a kernel: their comms are replaced by stubs that
+only count the messages and bytes that would be sent to the frontend.
+
+Usage:
+
+    python benchmarks/bench_dashboard.py --scales 1 10 100 --output results.json
+    python benchmarks/bench_dashboard.py --scales 1 --compare results.json
+
+Results are JSON, keyed by scale and by phase ('cold' parses with an empty
+columnar cache, 'warm' with the cache filled by the cold phase), and record
+the git commit they were measured on. The 'startup' entry holds the startup
+milestones of a fresh interpreter showing the dashboard's first paint.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'content'))
+
+import comm  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import loaders  # noqa: E402
+import synthetic  # noqa: E402
+from classes import App, BehavPlot, DemPlot, FileLoader, TractPlot  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from profiling import profiler  # noqa: E402
+
+
+class CountingComm(comm.base_comm.BaseComm):
+    '''Comm that sends nothing and counts what would have been sent.'''
+
+    messages = 0
+    bytes = 0
+
+    def publish_msg(self, msg_type, data=None, metadata=None, buffers=None, **keys):
+        CountingComm.messages += 1
+        CountingComm.bytes += len(json.dumps(data, default=str)) if data else 0
+        CountingComm.bytes += sum(len(memoryview(b).cast('B')) for b in buffers or ())
+
+
+def stub_comms():
+    comm.create_comm = CountingComm
+
+
+def upload(loader, content):
+    '''Simulate a file upload through the FileUpload widget.'''
+    loader._uploader.value = ({'name': 'behavioural.csv', 'type': 'text/csv',
+                               'size': len(content), 'content': memoryview(content),
+                               'last_modified': datetime.datetime.now()},)
+
+
+def interact_behav(plot):
+    measures = list(plot._x_dropdown.options)
+    plot._checkbox.value = True
+    for x, y in zip(measures, measures[1:]):
+        plot._x_dropdown.value = x
+        plot._y_dropdown.value = y
+    for age in plot._age_dropdown.options:
+        plot._age_dropdown.value = age
+        for sex in plot._sex_dropdown.options:
+            plot._sex_dropdown.value = sex
+    plot._corr_checkbox.value = True
+    plot._corr_checkbox.value = False
+    plot._checkbox.value = False
+
+
+def interact_dem(plot):
+    for age in plot._x_dropdown.options:
+        plot._x_dropdown.value = age
+
+
+def interact_tract(plot):
+    for tract in plot._tract_dropdown.options:
+        plot._tract_dropdown.value = tract
+    for measure in plot._y_dropdown.options:
+        plot._y_dropdown.value = measure
+
+
+def interact_app(plot):
+    indicators = list(plot._x_dropdown.options)
+    for x, y in zip(indicators, indicators[1:]):
+        plot._x_dropdown.value = x
+        plot._y_dropdown.value = y
+
+
+def run_phase(workdir, scale, content, cache_dir, repeat):
+    '''
+    Run all the interactions repeat times and return the profiler summary.
+    With cache_dir None, every run starts with an empty columnar cache.
+    '''
+    profiler.reset()
+    CountingComm.messages = CountingComm.bytes = 0
+
+    profiles = pd.concat([synthetic.profiles_frame(seed=i) for i in range(scale)], ignore_index=True)
+    indicators = synthetic.indicators_frame(n_rows=synthetic.HCP_SUBJECTS * scale * 10)
+    # App loads its initial data from the working directory
+    synthetic.indicators_frame(n_rows=100).to_csv(workdir / 'dummy_dataframe.csv', index=False)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for r in range(repeat):
+            loaders.CACHE_DIR = cache_dir or Path(tempfile.mkdtemp(dir=workdir))
+            loader = FileLoader()
+            dem = DemPlot(loader)
+            behav = BehavPlot(loader)
+            dem.container, behav.container
+            upload(loader, content)
+            interact_behav(behav)
+            interact_dem(dem)
+
+            with profiler.track('TractPlot', 'init'):
+                tract = TractPlot(profiles)
+            tract.container
+            interact_tract(tract)
+
+            app = App(FileLoader())
+            app.container
+            with profiler.track('App', 'update'):
+                app.update(Dataset(indicators))
+            interact_app(app)
+    finally:
+        os.chdir(cwd)
+
+    summary = profiler.summary()
+    summary['widget_comms'] = {'messages': CountingComm.messages, 'bytes': CountingComm.bytes}
+    return summary
+
+
+STARTUP = '''
+import json, sys
+from profiling import profiler
+sys.path.insert(0, {content!r})
+import classes
+profiler.mark('import')
+loader = classes.FileLoader()
+sections = [classes.LazySection('Demographics', lambda: classes.DemPlot(loader)),
+            classes.LazySection('Behavioural', lambda: classes.BehavPlot(loader))]
+profiler.mark('first paint')
+sections[0].show()
+print(json.dumps(profiler.milestones))
+'''
+
+
+def measure_startup(repeat):
+    '''
+    Startup milestones (seconds) of fresh interpreters that import the
+    dashboard and create its first screen, with its sections closed, then
+    open one section. Returns the median of each milestone over repeat runs.
+    '''
+    content = str(ROOT / 'content')
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', STARTUP.format(content=content)],
+                                      cwd=content, text=True)
+        runs.append(json.loads(out.splitlines()[-1]))
+    return {name: sorted(run[name] for run in runs)[len(runs) // 2] for name in runs[0]}
+
+
+def run(scales, repeat):
+    stub_comms()
+    profiler.enable()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for scale in scales:
+            csv = synthetic.write_behavioural(workdir / f'behavioural_{scale}x.csv',
+                                              n_rows=synthetic.HCP_SUBJECTS * scale)
+            content = csv.read_bytes()
+            cold = run_phase(workdir, scale, content, None, repeat)
+            cache_dir = workdir / f'cache_{scale}x'
+            run_phase(workdir, scale, content, cache_dir, 1) #fill the cache
+            warm = run_phase(workdir, scale, content, cache_dir, repeat)
+            results[f'{scale}x'] = {'rows': synthetic.HCP_SUBJECTS * scale,
+                                    'csv_bytes': len(content),
+                                    'cold': cold,
+                                    'warm': warm}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    '''Print the p50 ratio (current / baseline) of every common operation.'''
+    for scale, phases in results.items():
+        for phase in ('cold', 'warm'):
+            old = baseline.get('results', {}).get(scale, {}).get(phase, {})
+            for name, stats in phases[phase].items():
+                if name in old and 'p50_ms' in stats and old[name].get('p50_ms'):
+                    ratio = stats['p50_ms'] / old[name]['p50_ms']
+                    print(f'{scale:>5} {phase:<5} {name:<28} {old[name]["p50_ms"]:10.3f} ms '
+                          f'-> {stats["p50_ms"]:10.3f} ms  x{ratio:.2f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='multiples of the HCP behavioural table size')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scale and phase')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    args = parser.parse_args(argv)
+
+    report = {'commit': git_commit(),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'startup': measure_startup(args.repeat),
+              'results': run(args.scales, args.repeat)}
+
+    text = json.dumps(report, indent=2, default=float)
+    if args.output:
+        Path(args.output).write_text(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report['results'], json.load(f))
+    elif not args.output:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,54 +1,347 @@
-import pandas as pd
-import numpy as np
+import importlib.util
+import sys
+import threading
+import tracemalloc
 import ipywidgets as widgets
-from IPython.display import HTML, display
-from bqplot import Figure, Scatter, Axis, LinearScale, OrdinalScale, Hist, Bars, Pie, Tooltip
-from io import StringIO, BytesIO
 import abc #for abstract classes / observer pattern
+import asyncio
+from pathlib import Path
+from contextlib import contextmanager, ExitStack
 from abc import ABC
-import bqplot.marks as bqm
+from profiling import profiler
+
+
+def _lazy_import(name):
+    "Returns the module name, to be imported the first time one of its attributes is used."
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# Only ipywidgets is needed to show the file loader. The data and plotting
+# stacks are imported when the first plot is built or the first file parsed.
+np = _lazy_import('numpy')
+pd = _lazy_import('pandas')
+bqplot = _lazy_import('bqplot')
+cohort = _lazy_import('cohort')
+dataset = _lazy_import('dataset')
+loaders = _lazy_import('loaders')
+models = _lazy_import('models')
+slices = _lazy_import('slices')
+thumbnails = _lazy_import('thumbnails')
+
+
+def _same_value(old, new):
+    "Returns True if a trait value would not change by assigning new."
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        old, new = np.asarray(old), np.asarray(new)
+        return old.shape == new.shape and bool(np.array_equal(old, new))
+    try:
+        return bool(old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+class Redrawable:
+    '''
+    Mixin for plots that redraw themselves in _update_app.
+
+    Widget callbacks call _request_update instead of _update_app. Inside a
+    hold_updates() block, requests are only recorded, and _update_app runs
+    once when the outermost block exits. Requests made with debounce=True
+    (rapid UI events) are coalesced when they arrive within debounce
+    seconds of each other, if an event loop is running to schedule them.
+
+    _update_app should assign widget traits through _push, which only
+    sends the traits that changed and counts the messages sent, so that
+    the cost of each interaction is visible in last_sync_messages.
+
+    Widgets are created in _build_widgets, which is only called the first
+    time the container attribute is used, so that plots that are never
+    shown cost no widget models. Redraw requests made before that are
+    dropped, since building the widgets draws the current state.
+    '''
 
-class TractPlot:
+    debounce = 0.05 #seconds
+    sync_messages = 0 #widget state messages sent by _push since creation
+    last_sync_messages = 0 #widget state messages sent by the last redraw
+    _hold_depth = 0
+    _update_pending = False
+    _debounce_handle = None
+    _container = None
 
-    def __init__(self, df):
-        self._df = df
-        ##print(self._df.head())
-     
-        available_tracts = self._df['tractID'].unique()
+    @property
+    def container(self):
+        '''
+        The top-level widget of the plot, built on first use.
+        '''
+        if self._container is None:
+            with profiler.track(self, 'build'):
+                self._container = self._build_widgets()
+                self._on_built()
+        return self._container
+
+    def _build_widgets(self):
+        '''
+        Create the widgets and return the top-level one.
+        '''
+        raise NotImplementedError
+
+    def _on_built(self):
+        '''
+        Called once the widgets exist: draw the current state.
+        '''
+        self._update_app()
+
+    @contextmanager
+    def hold_updates(self):
+        '''
+        Suppress redraws inside the block and redraw once at the end
+        if anything requested it.
+        '''
+        self._hold_depth += 1
+        try:
+            yield
+        finally:
+            self._hold_depth -= 1
+            if self._hold_depth == 0 and self._update_pending:
+                self._update_pending = False
+                self._cancel_debounce()
+                self._redraw()
+
+    def _request_update(self, debounce=False):
+        '''
+        Ask for a redraw. It is deferred while updates are held, and
+        delayed by the debounce interval if debounce is True.
+        '''
+        if self._hold_depth:
+            self._update_pending = True
+            return
+        if debounce and self.debounce:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                self._cancel_debounce()
+                self._debounce_handle = loop.call_later(self.debounce, self._flush_update)
+                return
+        self._redraw()
+
+    def _flush_update(self):
+        self._debounce_handle = None
+        self._redraw()
+
+    def _redraw(self):
+        if self._container is None:
+            return
+        start = self.sync_messages
+        with profiler.track(self, '_update_app') as track:
+            self._update_app()
+            self.last_sync_messages = self.sync_messages - start
+            track.add(messages=self.last_sync_messages)
+
+    def _push(self, widget, **traits):
+        '''
+        Assign the given traits to a widget, skipping the ones that already
+        have that value. The changed traits are validated together and sent
+        in a single message. Returns the names of the traits that changed.
+        '''
+        changed = {name: value for name, value in traits.items()
+                   if not _same_value(getattr(widget, name), value)}
+        if changed:
+            with widget.hold_sync(), widget.hold_trait_notifications():
+                for name, value in changed.items():
+                    setattr(widget, name, value)
+            self.sync_messages += 1
+        return list(changed)
+
+    def _cancel_debounce(self):
+        if self._debounce_handle is not None:
+            self._debounce_handle.cancel()
+            self._debounce_handle = None
+
+    def _update_app(self):
+        raise NotImplementedError
+
+
+class DensityScatter:
+    '''
+    Mixin for Redrawable plots with a scatter mark that may get too many
+    points for the browser to draw.
+
+    Above lod_threshold points, the scatter is replaced by a binned 2D
+    density (a HeatMap behind the other marks), with a random subsample of
+    lod_sample points drawn on top. At or below the threshold, the raw
+    points are drawn again. Set lod_sample to 0 to hide the subsample.
+    '''
+
+    lod_threshold = 20000
+    lod_bins = 64
+    lod_sample = 2000
+
+    def _init_density(self):
+        '''
+        Create the density mark. Call after self._scatter and self._figure exist.
+        '''
+        self._base_marks = list(self._figure.marks)
+        self._heatmap = bqplot.HeatMap(color=np.zeros((2, 2)),
+                                       scales={'x': self._scatter.scales['x'],
+                                               'y': self._scatter.scales['y'],
+                                               'color': bqplot.ColorScale(scheme='Blues')})
+
+    @property
+    def lod(self):
+        "The level-of-detail settings, as keyword arguments for lod.reduce_points."
+        return dict(threshold=self.lod_threshold, bins=self.lod_bins, sample=self.lod_sample)
+
+    def _show_points(self, points):
+        '''
+        Draw points as returned by lod.reduce_points: raw points, or a
+        density with a subsample of the points on top.
+        '''
+        if points['density'] is not None:
+            x_centers, y_centers, counts = points['density']
+            self._push(self._heatmap, x=x_centers, y=y_centers, color=counts)
+            self._push(self._figure, marks=[self._heatmap] + self._base_marks)
+        else:
+            self._push(self._figure, marks=self._base_marks)
+        self._push(self._scatter, x=points['x'], y=points['y'])
+
+
+class LazySection:
+    '''
+    A collapsible dashboard section whose content is only built the
+    first time it is opened, and a startup milestone recorded then.
+    '''
+
+    def __init__(self, title, build, open=False):
+        '''
+        Parameters
+        -----------
+        title : title of the section
+        build : function returning the content, a widget or a plot
+            (anything with a container attribute)
+        open : if True, build and open the section right away
+        '''
+        self.title = title
+        self.content = None
+        self._build = build
+        self.container = widgets.Accordion(children=[widgets.VBox()], titles=(title,))
+        self.container.observe(self._on_toggle, names='selected_index')
+        if open:
+            self.show()
+
+    def _on_toggle(self, change):
+        if change['new'] is not None and self.content is None:
+            self.show()
+
+    def show(self):
+        '''
+        Build the content if needed and open the section.
+        '''
+        if self.content is None:
+            with profiler.track(f'LazySection[{self.title}]', 'build'):
+                content = self._build()
+                self.content = getattr(content, 'container', content)
+            self.container.children[0].children = [self.content]
+            profiler.mark(f'{self.title} shown')
+        self.container.selected_index = 0
+
+
+class TractPlot(Redrawable):
+
+    # tracts before and after the selected one whose bundle images are prefetched
+    prefetch_neighbours = 2
+
+    def __init__(self, df, images=None):
+        '''
+        Parameters
+        -----------
+        df : profiles DataFrame, or models.TractIndex
+        images : optional dict mapping tracts to the paths of their
+            bundle renderings, shown next to the profile
+        '''
+        self._model = models.TractModel(df)
+        self._thumbnails = thumbnails.Thumbnails(images) if images else None
+
+    def _build_widgets(self):
+        available_tracts = self._model.tracts
 
-        self._measures = {'Fractional Anisotropy':'dki_fa','Mean Diffusivity':'dki_md','Mean Kurtosis':'dki_mk','Axonal Water Fraction':'dki_awf'}
         self._tract_dropdown = self._create_dropdown(available_tracts, 0)
-        self._y_dropdown = self._create_dropdown(list(self._measures.keys()), 0)
+        self._y_dropdown = self._create_dropdown(self._model.labels, 0)
 
-        x_scale = LinearScale()
-        y_scale = LinearScale()
+        x_scale = bqplot.LinearScale()
+        y_scale = bqplot.LinearScale()
 
-        self._x_axis = Axis(scale=x_scale, label="X")
-        self._y_axis = Axis(scale=y_scale, orientation="vertical", label="Y")
+        self._x_axis = bqplot.Axis(scale=x_scale, label="node")
+        self._y_axis = bqplot.Axis(scale=y_scale, orientation="vertical", label="Y")
 
-        self._scatter = Scatter(
-            x=[], y=[], scales={"x": x_scale, "y": y_scale}
+        self._scatter = bqplot.Scatter(
+            x=[], y=[], scales={"x": x_scale, "y": y_scale}, default_opacities=[0.5]
         )
 
-        self._figure = Figure(marks=[self._scatter], axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
+        # cohort bands, drawn behind the subject's profile once set_cohort_stats is called
+        self._quantile_band = bqplot.Lines(x=[], y=[], scales={'x': x_scale, 'y': y_scale}, visible=False,
+                                           fill='between', colors=['lightgray'], fill_colors=['lightgray'],
+                                           fill_opacities=[0.4], stroke_width=0)
+        self._sd_band = bqplot.Lines(x=[], y=[], scales={'x': x_scale, 'y': y_scale}, visible=False,
+                                     fill='between', colors=['steelblue'], fill_colors=['steelblue'],
+                                     fill_opacities=[0.3], stroke_width=0)
+        self._mean_line = bqplot.Lines(x=[], y=[], scales={'x': x_scale, 'y': y_scale},
+                                       colors=['steelblue'], line_style='dashed')
+
+        self._figure = bqplot.Figure(marks=[self._quantile_band, self._sd_band, self._mean_line, self._scatter],
+                                     axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
 
+        # bundle rendering of the selected tract, hidden when there is none
+        self._image = widgets.Image(format='gif', layout=widgets.Layout(width=f'{thumbnails.SIZE}px', display='none'))
 
         _app_container = widgets.VBox([
             widgets.HBox([self._tract_dropdown, self._y_dropdown]),
             self._figure,
             # year_slider_box
         ], layout=widgets.Layout(align_items='center', flex='3 0 auto'))
-        self.container = widgets.VBox([
+        return widgets.VBox([
             widgets.HBox([
                 _app_container,
-            ])
+                self._image,
+            ], layout=widgets.Layout(align_items='center'))
         ], layout=widgets.Layout(flex='1 1 auto', margin='0 auto 0 auto', max_width='1024px'))
-        self._update_app()
 
     @classmethod
     def from_csv(cls, path):
-        df = pd.read_csv(path)
-        return cls(df)
+        '''
+        Plot a profiles CSV file, with the bundle renderings of the
+        viz_bundles directory next to it if there is one.
+        '''
+        df, _ = loaders.compact_frame(loaders.read_csv_cached(path))
+        return cls(df, images=thumbnails.bundle_images(Path(path).parent))
+
+    @classmethod
+    def from_store(cls, store, subject=None):
+        '''
+        Plot one subject of a cohort profiles store.
+
+        Parameters
+        -----------
+        store : cohort.CohortStore, or the directory it was saved to
+        subject : subject ID, defaults to the first subject in the store
+        '''
+        if not isinstance(store, cohort.CohortStore):
+            store = cohort.CohortStore.open(store)
+        if subject is None:
+            subject = store.subjects[0]
+        index = models.TractIndex.from_array(store.subject(subject), store.tracts, store.nodes, store.measures)
+        return cls(index)
 
     def _create_dropdown(self, options, initial_index):
         dropdown = widgets.Dropdown(options=options, value=options[initial_index])
@@ -56,26 +349,59 @@ class TractPlot:
         return dropdown
 
     def _on_change(self, _):
-        self._update_app()
+        self._request_update(debounce=True)
 
-    def _update_app(self):
-        tract = self._tract_dropdown.value
-        y_indicator = self._y_dropdown.value
+    def set_cohort_stats(self, stats):
+        '''
+        Draw the distribution of a cohort behind the profile: its mean,
+        a mean +/- SD band, and a band between the 5th and 95th percentiles.
 
-        with self._scatter.hold_sync():          
-            
-            df = self._df.loc[self._df['tractID'] == tract]
-            
-            x = df['nodeID']
-            y = df[self._measures[y_indicator]]
+        Parameters
+        -----------
+        stats : cohort.CohortStats, or None to remove the bands
+        '''
+        self._model.stats = stats
+        self._request_update()
 
-            self._x_axis.label = 'node'
-            self._y_axis.label = y_indicator
-            
-            self._scatter.default_opacities = [0.5]
+    def set_bundle_images(self, images):
+        '''
+        Show the bundle rendering of the selected tract next to the profile.
+
+        Parameters
+        -----------
+        images : dict mapping tracts to image paths (see
+            thumbnails.bundle_images), or None to hide the images
+        '''
+        if self._thumbnails is not None:
+            self._thumbnails.close()
+        self._thumbnails = thumbnails.Thumbnails(images) if images else None
+        self._request_update()
+
+    def _show_bundle(self, tract):
+        data = None if self._thumbnails is None else self._thumbnails.get(tract)
+        if data is None:
+            self._push(self._image.layout, display='none')
+        else:
+            self._push(self._image, value=data)
+            self._push(self._image.layout, display=None)
+        if self._thumbnails is None or tract not in self._thumbnails:
+            return
+
+        # load the neighbouring tracts in the dropdown, nearest first
+        tracts = list(self._tract_dropdown.options)
+        i = tracts.index(tract)
+        self._thumbnails.prefetch(tracts[j] for k in range(1, self.prefetch_neighbours + 1)
+                                  for j in (i + k, i - k) if 0 <= j < len(tracts))
 
-            self._scatter.x = x
-            self._scatter.y = y
+    def _update_app(self):
+        view = self._model.render(self._tract_dropdown.value, self._y_dropdown.value)
+        self._push(self._y_axis, label=view['y_label'])
+        bands = len(view['band_x']) > 0
+        self._push(self._quantile_band, x=view['band_x'], y=view['quantile_band'], visible=bands)
+        self._push(self._sd_band, x=view['band_x'], y=view['sd_band'], visible=bands)
+        self._push(self._mean_line, x=view['band_x'], y=view['mean'])
+        self._push(self._scatter, x=view['x'], y=view['y'])
+        self._show_bundle(self._tract_dropdown.value)
 
 
 
@@ -106,15 +432,61 @@ class Subject:
         '''
         Iterates through and calls update on all of the observers.
         '''
-        for i, obj in enumerate(self._observers):
-            obj.update(data)
+        with profiler.track(self, 'notify') as track, self.transaction():
+            track.add(rows=len(data))
+            for i, obj in enumerate(self._observers):
+                with profiler.track(obj, 'update'):
+                    obj._receive(data)
+
+    def _notify_preview(self, data):
+        '''
+        Hand the first rows of data that are still being loaded to the
+        observers, for a quick first render.
+        '''
+        with self.transaction():
+            for obj in self._observers:
+                obj.preview(data)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Hold redraws of all observers for the duration of the block,
+        so that each of them redraws at most once when it exits.
+        '''
+        with ExitStack() as stack:
+            for obj in self._observers:
+                stack.enter_context(obj.hold_updates())
+            yield
+
+    def _requested_columns(self):
+        '''
+        Union of the columns declared by the observers, as a dict mapping
+        column names to dtypes. Returns None if any observer needs all columns,
+        or if no columns are declared (e.g. there are no observers yet).
+        '''
+        columns = {}
+        for obj in self._observers:
+            if obj.columns is None:
+                return None
+            for name, dtype in obj.columns.items():
+                if columns.get(name) is None:
+                    columns[name] = dtype
+        return columns or None
 
 
 
-class Observer(ABC):
+class Observer(Redrawable, ABC):
     '''
     Abstract class.
+
+    Subclasses declare the data columns they use in the columns attribute,
+    a dict mapping column names to dtypes (None to let pandas infer it).
+    The subject only parses the columns requested by its observers.
+    If columns is None, the observer gets every column of the file.
     '''
+
+    columns = None
+    _pending_data = None
     
     def __init__(self, subject):
         '''
@@ -123,6 +495,30 @@ class Observer(ABC):
         self._subject = subject
         subject._register_observer(self)
 
+    def _receive(self, data):
+        '''
+        Called by the subject with new data. Until the widgets are built,
+        only the latest data are kept, and update runs when they are.
+        '''
+        if self._container is None:
+            self._pending_data = data
+        else:
+            self.update(data)
+
+    def _on_built(self):
+        data, self._pending_data = self._pending_data, None
+        if data is not None:
+            self.update(data)
+        else:
+            super()._on_built()
+
+    def preview(self, data):
+        '''
+        Called with the first rows of data that are still being loaded.
+        Observers that can draw them quickly override this; update is
+        called anyway once all the data are loaded.
+        '''
+
     @abc.abstractmethod
     def update(self, data):
         '''
@@ -132,7 +528,7 @@ class Observer(ABC):
 
         Parameters
         -----------
-        data : csv in bytes, use pd.read_csv(data)
+        data : dataset.Dataset, shared by all observers and read-only
         '''
         ...
 
@@ -144,20 +540,50 @@ class FileLoader(Subject):
     When the user uses the widget to upload a local CSV file,
     the data are loaded into the class's data attribute.
 
+    Files are parsed in chunks off the widget callback: in an asyncio task
+    in the browser (where there are no threads), in a worker thread when
+    the kernel runs an event loop, and synchronously when nothing does
+    (e.g. in scripts). A progress bar follows the parse, the first chunk
+    is handed to the observers as a preview, and a new upload cancels the
+    parse of the previous one. Observers are notified once, with all rows.
+    A file that cannot be parsed is reported in the status line.
+
+    The upload is parsed from the widget's buffer in place, and the widget
+    value is cleared right away, so the file is not kept after parsing:
+    only its content hash is, to recognise a second upload of the same
+    file. For profiling, set trace_memory: when the parse runs on the
+    kernel's thread (in the browser and in scripts), the peak of the Python
+    allocations traced by tracemalloc while parsing is shown once done. It
+    leaves out the parser's C buffers and the upload itself, and tracing
+    slows the parse down, so it is off by default.
+
     Inherits from the Subject class, because it needs to be the one
     to signal and update all the other plot classes.
     '''
+
+    chunksize = 20000 #rows parsed between progress updates
+    trace_memory = False #trace the Python allocations of parsing with tracemalloc, off worker threads
     
     def __init__(self):
         super().__init__()
         
         self.data = None
+        self.preview = None #first rows of the file being parsed
+        self.content_hash = None #of the latest upload, which is not kept
+        self._loaded = None #content hash and columns of the latest upload
+        self._generation = 0 #number of the latest upload; older parses stop
+        self._tracing = False #whether this loader started tracemalloc
         self._uploader = self._create_uploader()
+        self._progress = widgets.FloatProgress(value=0, min=0, max=1, description='Parsing',
+                                               layout=widgets.Layout(visibility='hidden'))
+        self._status = widgets.Label()
 
         _app_container = widgets.VBox([
             widgets.HTML(('<p>Viewing HCP demographics and behavioural data requires you to have registered on <i style="color:blue"><a href="www.humanconnectome.org">the HCP website</a></i>, accepted the data terms, and downloaded the Behavioural Data CSV file.</p>'
                          '<p>If you do have this file, specify its local path below:</p>')),
-            self._uploader])
+            self._uploader,
+            self._progress,
+            self._status])
         self.container = widgets.VBox([_app_container])
 
     def _create_uploader(self): #creates the file uploader widget and observes when there are changes
@@ -165,60 +591,201 @@ class FileLoader(Subject):
         uploader.observe(self._on_change, names='value')
         return uploader
 
-    def _on_change(self, _): #called when user uploads file using the widget
+    def _on_change(self, change): #called when user uploads file using the widget
+        if not change['new']:
+            return #the value was cleared below
         #get the data:
-        content = next(iter(self._uploader.value))['content']
-        content_to_bytes = BytesIO(content)
-        df = pd.read_csv(content_to_bytes)
-        self.data = df
+        upload = next(iter(change['new']))
+        content = upload['content']
+        self._uploader.value = () #the widget would keep the file for the rest of the session
+
+        digest = loaders.content_hash(content)
+        columns = self._requested_columns()
+        if self._loaded == (digest, columns):
+            self._status.value = f"{upload['name']} is already loaded"
+            return
+        self.content_hash = digest
+        self._loaded = (digest, columns)
+        self._status.value = f"Loading {upload['name']}..."
+
+        self._generation += 1
+        job = (self._generation, upload['name'])
+        steps = self._parse(content, upload['name'], digest, columns, self._generation)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            self._start_trace()
+            self._run(steps, job, lambda function, *args: function(*args))
+        elif sys.platform == 'emscripten':
+            self._start_trace()
+            loop.create_task(self._run_async(steps, job))
+        else:
+            # allocations of a worker thread cannot be told apart from the
+            # kernel's, so the parse's memory is not measured there
+            self._stop_trace()
+            threading.Thread(target=self._run, args=(steps, job, loop.call_soon_threadsafe), daemon=True).start()
+
+    def _parse(self, content, name, digest, columns, generation):
+        '''
+        Parse an upload chunk by chunk. Yields (generation, fraction done,
+        preview) after each chunk, where preview is the first chunk (None
+        after it), and stops early if a newer upload started. Returns
+        (generation, parsed table, status message), with no table if it
+        stopped early.
+        '''
+        chunks = []
+        with profiler.track(self, 'parse') as track:
+            for chunk, done in loaders.iter_csv_cached(content, columns=columns, chunksize=self.chunksize,
+                                                       digest=digest):
+                if generation != self._generation:
+                    return generation, None, None
+                chunks.append(chunk)
+                yield generation, done, (chunk if len(chunks) == 1 and done < 1 else None)
+            df, saved = loaders.compact_frame(loaders.concat_chunks(chunks))
+            size = memoryview(content).nbytes
+            status = f'{name}: {len(df)} rows, {size / 2**20:.1f} MB'
+            if self._tracing and generation == self._generation:
+                peak = tracemalloc.get_traced_memory()[1]
+                track.add(traced_bytes=peak)
+                status += f', peak traced Python allocations {peak / 2**20:.1f} MB'
+            track.add(rows=len(df), bytes=size, bytes_saved=saved)
+        return generation, df, status
+
+    def _start_trace(self):
+        '''
+        Trace the Python allocations of the upload about to be parsed, on
+        the kernel's thread. Does nothing if tracemalloc was started elsewhere.
+        '''
+        if not self.trace_memory:
+            return
+        if self._tracing:
+            tracemalloc.reset_peak() #of the parse this upload replaces
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def _stop_trace(self):
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def _run(self, steps, job, call):
+        '''
+        Run the parse to the end, handing the progress and the result (or
+        the error) to the kernel's thread through call(function, *args).
+        job is the (generation, file name) of the upload.
+        '''
+        try:
+            while True:
+                call(self._on_progress, *next(steps))
+        except StopIteration as stop:
+            result = stop.value
+        except Exception as error:
+            call(self._on_failed, *job, error)
+            return
+        call(self._finish, job, result)
+
+    async def _run_async(self, steps, job):
+        try:
+            while True:
+                self._on_progress(*next(steps))
+                await asyncio.sleep(0) #let the kernel send the progress and handle other messages
+        except StopIteration as stop:
+            result = stop.value
+        except Exception as error:
+            self._on_failed(*job, error)
+            return
+        self._finish(job, result)
+
+    def _finish(self, job, result):
+        "Hand the parsed table to the observers, reporting their errors like parse errors."
+        try:
+            self._on_parsed(*result)
+        except Exception as error:
+            self._on_failed(*job, error)
+
+    def _on_progress(self, generation, done, preview):
+        if generation != self._generation:
+            return
+        self._progress.value = done
+        self._progress.layout.visibility = 'visible'
+        if preview is not None:
+            self.preview = dataset.Dataset(preview)
+            self._notify_preview(self.preview)
+
+    def _on_parsed(self, generation, df, status):
+        if df is None or generation != self._generation:
+            return
+        self._stop_trace()
+        self._progress.layout.visibility = 'hidden'
+        self._status.value = status
+        if self.data is not None:
+            self.data.release() #drop the previous upload and everything derived from it
+        self.data = dataset.Dataset(df)
+        self.preview = None
         self._notify(self.data) #send notification to observers
 
+    def _on_failed(self, generation, name, error):
+        if generation != self._generation:
+            return
+        self._stop_trace()
+        self._progress.layout.visibility = 'hidden'
+        self._status.value = f'Could not load {name}: {error}'
+        self._loaded = None #let the same file be uploaded again
+        if self.preview is not None and self.data is not None:
+            self._notify(self.data) #replace the preview by the last file loaded
+        self.preview = None
 
-class App(Observer):
+
+class App(DensityScatter, Observer):
     '''
     Demo interactive plotter app.
 
     Inherits from the Observer class, because it needs to
     be notified when there are updates.
     '''
+
+    columns = {'Indicator Name': 'category', 'Country Name': 'category', 'Year': None, 'Value': 'float32'}
     
     def __init__(self, subject):
         super().__init__(subject) #run init from parent
 
+    def _build_widgets(self):
         df = pd.read_csv('dummy_dataframe.csv') #initialize plot with dummy data
         self._df = df
+        self._model = models.IndicatorModel(df)
 
-        available_indicators = self._df['Indicator Name'].unique()
+        available_indicators = self._model.indicators
         self._x_dropdown = self._create_indicator_dropdown(available_indicators, 0)
         self._y_dropdown = self._create_indicator_dropdown(available_indicators, 1)
 
-        x_scale = LinearScale()
-        y_scale = LinearScale()
+        x_scale = bqplot.LinearScale()
+        y_scale = bqplot.LinearScale()
 
-        self._x_axis = Axis(scale=x_scale, label="X")
-        self._y_axis = Axis(scale=y_scale, orientation="vertical", label="Y")
+        self._x_axis = bqplot.Axis(scale=x_scale, label="X")
+        self._y_axis = bqplot.Axis(scale=y_scale, orientation="vertical", label="Y")
 
-        self._scatter = Scatter(
-            x=[], y=[], scales={"x": x_scale, "y": y_scale}
+        self._scatter = bqplot.Scatter(
+            x=[], y=[], scales={"x": x_scale, "y": y_scale}, default_opacities=[0.2]
         )
 
-        self._figure = Figure(marks=[self._scatter], axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
+        self._figure = bqplot.Figure(marks=[self._scatter], axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
+        self._init_density()
 
-        self._year_slider, self._year_slider_box = self._create_year_slider(
-            min(df['Year']), max(df['Year'])
-        )
+        self._year_slider, self._year_slider_box = self._create_year_slider(*self._model.years)
 
         _app_container = widgets.VBox([
             widgets.HBox([self._x_dropdown, self._y_dropdown]),
             self._figure,
             self._year_slider_box
         ], layout=widgets.Layout(align_items='center', flex='3 0 auto'))
-        self.container = widgets.VBox([
+        return widgets.VBox([
             widgets.HBox([
                 _app_container,
             ])
         ], layout=widgets.Layout(flex='1 1 auto', margin='0 auto 0 auto', max_width='1024px'))
-        self._update_app()
 
     def _create_indicator_dropdown(self, indicators, initial_index):
         dropdown = widgets.Dropdown(options=indicators, value=indicators[initial_index])
@@ -237,7 +804,7 @@ class App(Observer):
         return year_slider, year_slider_box
 
     def _on_change(self, _):
-        self._update_app()
+        self._request_update(debounce=True)
 
     def update(self, data):
         '''
@@ -246,30 +813,20 @@ class App(Observer):
 
         Parameters
         -----------
-        data : csv in bytes, use pd.read_csv(data)
+        data : dataset.Dataset, shared by all observers and read-only
         '''
-        df = pd.read_csv(data)
-        self._df = df
-        self._new_data_reset()
-        self._update_app()
+        with self.hold_updates():
+            self._df = data.project(self.columns)
+            self._model = models.IndicatorModel(self._df)
+            self._new_data_reset()
+            self._request_update()
 
     def _update_app(self):
-        x_indicator = self._x_dropdown.value
-        y_indicator = self._y_dropdown.value
-        year_range = self._year_slider.value
-
-        with self._scatter.hold_sync():
-            df = self._df[self._df['Year'].between(*year_range)].dropna()
-            x = df[df['Indicator Name'] == x_indicator]['Value']
-            y = df[df['Indicator Name'] == y_indicator]['Value']
-
-            self._x_axis.label = x_indicator
-            self._y_axis.label = y_indicator
-
-            self._scatter.default_opacities = [0.2]
-
-            self._scatter.x = x
-            self._scatter.y = y
+        view = self._model.render(self._x_dropdown.value, self._y_dropdown.value,
+                                  self._year_slider.value, **self.lod)
+        self._push(self._x_axis, label=view['x_label'])
+        self._push(self._y_axis, label=view['y_label'])
+        self._show_points(view['points'])
 
     def _new_data_reset(self):
         '''
@@ -277,10 +834,8 @@ class App(Observer):
         Gets called by the observer update function when new data
         are loaded via the File Loader.
         '''
-        df = self._df #set new dta
-
         #set new dropdown options
-        available_indicators = self._df['Indicator Name'].unique()
+        available_indicators = self._model.indicators
         self._x_dropdown.options = available_indicators
         self._x_dropdown.value = available_indicators[0]
         
@@ -288,14 +843,18 @@ class App(Observer):
         self._y_dropdown.value = available_indicators[1]
 
         #reset the range on the year slider
-        self._year_slider.min = min(df['Year'])
-        self._year_slider.max = max(df['Year'])
+        self._year_slider.min, self._year_slider.max = self._model.years
 
 
 class DemPlot(Observer):
+
+    dimensions = ['Age', 'Gender']
+    columns = {name: 'category' for name in dimensions}
+
     def __init__(self, subject):
         super().__init__(subject)
-        
+
+    def _build_widgets(self):
         # Create an Output widget for capturing print output
         #self.output_widget = widgets.Output()
         #display(self.output_widget)
@@ -305,6 +864,7 @@ class DemPlot(Observer):
             'Gender': [np.nan]
         })
         self._df = df
+        self._model = models.DemModel(df, self.dimensions)
      
         age = self._df['Age'] #T1_Count
         gender = self._df['Gender']
@@ -315,28 +875,28 @@ class DemPlot(Observer):
         age_options = ['All ages'] + sorted(age.unique())
         self._x_dropdown = self._create_dropdown(age_options, 0)
 
-        x_scale = OrdinalScale()
-        y_scale = LinearScale()
+        x_scale = bqplot.OrdinalScale()
+        y_scale = bqplot.LinearScale()
 
-        self._x_axis = Axis(scale=x_scale, label="Age")
-        self._y_axis = Axis(scale=y_scale, orientation="vertical", label="N")
+        self._x_axis = bqplot.Axis(scale=x_scale, label="Age")
+        self._y_axis = bqplot.Axis(scale=y_scale, orientation="vertical", label="N")
 
-        self._age_bars = Bars(x=age_counts.index, y=age_counts.values,
+        self._age_bars = bqplot.Bars(x=age_counts.index, y=age_counts.values,
                           scales={'x': x_scale, 'y': y_scale})
-        tooltip = Tooltip(fields=['x', 'y'], labels=['Age', 'N'])
+        tooltip = bqplot.Tooltip(fields=['x', 'y'], labels=['Age', 'N'])
         self._age_bars.tooltip = tooltip
-        #self._gender_bars = Bars(x=gender_counts.index, y=gender_counts.values,
+        #self._gender_bars = bqplot.Bars(x=gender_counts.index, y=gender_counts.values,
         #                  scales={'x': x_scale, 'y': y_scale})
-        self._gender_pie = Pie(labels=gender_counts.index.tolist(), sizes=gender_counts.values,
+        self._gender_pie = bqplot.Pie(labels=gender_counts.index.tolist(), sizes=gender_counts.values,
                      display_labels='inside')
-        tooltip = Tooltip(fields=['label', 'size'], labels=['Gender', 'N'])
+        tooltip = bqplot.Tooltip(fields=['label', 'size'], labels=['Gender', 'N'])
         self._gender_pie.tooltip = tooltip
 
 
-#       self._figure = Figure(marks=[self._scatter], axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
-        self._age_figure = Figure(marks=[self._age_bars], axes=[self._x_axis, self._y_axis],
+#       self._figure = bqplot.Figure(marks=[self._scatter], axes=[self._x_axis, self._y_axis], layout=dict(width="99%"), animation_duration=1000)
+        self._age_figure = bqplot.Figure(marks=[self._age_bars], axes=[self._x_axis, self._y_axis],
                              layout=dict(width="99%"), title='Age brackets')
-        self._gender_figure = Figure(marks=[self._gender_pie],
+        self._gender_figure = bqplot.Figure(marks=[self._gender_pie],
                                     layout=dict(width="300px"), title='Gender')
 
         # Define a function to update the radius dynamically
@@ -367,7 +927,7 @@ class DemPlot(Observer):
             self._gender_figure,
             # year_slider_box
         ], layout=widgets.Layout(align_items='center', flex='3 0 auto'))
-        self.container = widgets.VBox([
+        return widgets.VBox([
             # widgets.HTML(
             #     (
             #         '<h1>Development indicators. A Voici dashboard, running entirely in your browser!</h1>'
@@ -380,7 +940,6 @@ class DemPlot(Observer):
                 #widgets.HTML(EXPLANATION, layout=widgets.Layout(margin='0 0 0 2em'))
             ])
         ], layout=widgets.Layout(flex='1 1 auto', margin='0 auto 0 auto', max_width='1024px'))
-        self._update_app()
 
     def _create_dropdown(self, options, initial_index):
         dropdown = widgets.Dropdown(options=options, value=options[initial_index])
@@ -388,7 +947,7 @@ class DemPlot(Observer):
         return dropdown
 
     def _on_change(self, _):
-        self._update_app()
+        self._request_update(debounce=True)
 
     def update(self, data):
         '''
@@ -397,54 +956,49 @@ class DemPlot(Observer):
 
         Parameters
         -----------
-        data : csv in bytes, use pd.read_csv(data)
+        data : dataset.Dataset, shared by all observers and read-only
         '''
-        #print(data)
-        #df = pd.read_csv(data)
-        #self._df = df
-        self._df = data
-        #print(self._df)
+        with self.hold_updates():
+            self._df = data.project(self.columns)
+            self._model = models.DemModel(self._df, self.dimensions)
+            self._refresh_counts()
+            self._request_update()
 
+    def preview(self, data):
+        '''
+        Counts are cheap: show those of the first rows while the rest load.
+        '''
+        self._receive(data)
 
-        age = self._df['Age'] #T1_Count
-        gender = self._df['Gender']
-        #print(age)
-
-        age_counts = age.value_counts()
-        # Sort age_counts by index to ensure alphanumerical order
-        age_counts = age.value_counts().sort_index()
-        gender_counts = gender.value_counts()
-
-        age_options = ['All ages'] + sorted(age.unique())
-
-        x_scale = OrdinalScale()
-        y_scale = LinearScale()
-
-        self._x_axis = Axis(scale=x_scale, label="Age")
-        self._y_axis = Axis(scale=y_scale, orientation="vertical", label="N")
-
-        self._x_dropdown.options = age_options
-
-        self._age_bars.x = age_counts.index
-        self._age_bars.y = age_counts.values
-        self._age_bars.scales = {'x': x_scale, 'y': y_scale}
-
-        self._age_figure.axes = [self._x_axis, self._y_axis]
-
-        self._gender_pie.labels = gender_counts.index.tolist()
-        self._gender_pie.sizes = gender_counts.values
-
+    def append(self, rows):
+        '''
+        Add rows (a DataFrame with the demographic columns) to the counts
+        without recounting the rows already seen.
+        '''
+        self.container #the counts are set up with the widgets
+        with self.hold_updates():
+            self._model.append(rows)
+            self._refresh_counts()
+            self._request_update()
 
-     #   self._new_data_reset()
-        self._update_app()
+    def _refresh_counts(self):
+        '''
+        Update the age brackets after the counts have changed.
+        '''
+        options = self._model.ages
+        selected = self._x_dropdown.value
+        self._x_dropdown.options = options
+        if selected in options:
+            self._x_dropdown.value = selected
 
     def _update_app(self):
-        age_selected = self._x_dropdown.value
+        view = self._model.render(self._x_dropdown.value)
 
         default_color = 'steelblue'
         highlight_color = 'red'
-        colors = [highlight_color if val == age_selected else default_color for val in self._age_bars.x]
-        self._age_bars.colors = colors
+        colors = np.where(view['highlight'], highlight_color, default_color).tolist()
+        self._push(self._age_bars, x=view['ages'], y=view['age_counts'], colors=colors)
+        self._push(self._gender_pie, labels=view['genders'], sizes=view['gender_counts'])
 
 #        tract = self._x_dropdown.value
  #       # x_indicator = self._x_dropdown.value
@@ -467,11 +1021,20 @@ class DemPlot(Observer):
   #          self._scatter.y = y
     
 
-class BehavPlot(Observer):
+class BehavPlot(DensityScatter, Observer):
+
+    measures = ['PicSeq_AgeAdj', 'CardSort_AgeAdj', 'Flanker_AgeAdj', 'ListSort_AgeAdj',
+                'ReadEng_AgeAdj', 'PicVocab_AgeAdj', 'ProcSpeed_AgeAdj',
+                'FS_TotCort_GM_Vol', 'FS_SubCort_GM_Vol', 'FS_Total_GM_Vol',
+                'FS_L_WM_Vol', 'FS_R_WM_Vol', 'FS_Tot_WM_Vol']
+    columns = {'Subject': None, 'Age': 'category', 'Gender': 'category',
+               **{name: 'float32' for name in measures}}
 
     def __init__(self, subject):
         super().__init__(subject)
-        
+        self._features = None
+
+    def _build_widgets(self):
         # df = pd.read_csv('hcp_dummy.csv') #initialize plot with dummy data
         df = pd.DataFrame({'PicSeq_AgeAdj':[np.nan],
                            'CardSort_AgeAdj':[np.nan],
@@ -493,6 +1056,7 @@ class BehavPlot(Observer):
         # print(self._df.index)
      
         self._measures = self._df.columns
+        self._model = models.BehavModel(self._df, self._measures)
         
         #print(self._measures)
 
@@ -505,20 +1069,32 @@ class BehavPlot(Observer):
         self._age_dropdown = self._create_toggle(age_options, 0)
         self._sex_dropdown = self._create_toggle(sex_options, 0)
         self._checkbox = self._create_checkbox('show regression line', False)
+        self._corr_checkbox = self._create_checkbox('show correlation matrix', False)
 
-        x_scale = LinearScale()
-        y_scale = LinearScale()
+        x_scale = bqplot.LinearScale()
+        y_scale = bqplot.LinearScale()
 
-        self._x_axis = Axis(scale=x_scale, label="X")
-        self._y_axis = Axis(scale=y_scale, orientation="vertical", label="Y", label_offset = '3.9em')
+        self._x_axis = bqplot.Axis(scale=x_scale, label="X")
+        self._y_axis = bqplot.Axis(scale=y_scale, orientation="vertical", label="Y", label_offset = '3.9em')
 
-        self._scatter = Scatter(
-            x=[], y=[], scales={"x": x_scale, "y": y_scale}
+        self._scatter = bqplot.Scatter(
+            x=[], y=[], scales={"x": x_scale, "y": y_scale}, default_opacities=[0.5]
         )
 
-        self._line = bqm.Lines(scales={'x': x_scale, 'y': y_scale}, colors = ['black'])
+        self._line = bqplot.Lines(scales={'x': x_scale, 'y': y_scale}, colors = ['black'])
 
-        self._figure = Figure(marks=[self._scatter, self._line], axes=[self._x_axis, self._y_axis], layout=dict(width="95%"),animation_duration=500)
+        self._figure = bqplot.Figure(marks=[self._scatter, self._line], axes=[self._x_axis, self._y_axis], layout=dict(width="95%"),animation_duration=500)
+        self._init_density()
+
+        self._corr_map = bqplot.GridHeatMap(color=np.zeros((2, 2)),
+                                            scales={'row': bqplot.OrdinalScale(reverse=True), 'column': bqplot.OrdinalScale(),
+                                                    'color': bqplot.ColorScale(scheme='RdBu', min=-1, max=1)},
+                                            interactions={'click': 'select'})
+        self._corr_map.tooltip = bqplot.Tooltip(fields=['color'], labels=['r'])
+        self._corr_map.observe(self._on_corr_select, names=['selected'])
+        self._corr_figure = bqplot.Figure(marks=[self._corr_map], title='Correlation (click a cell to plot that pair)',
+                                          fig_margin=dict(top=40, bottom=120, left=140, right=20),
+                                          layout=dict(width="95%", height="500px", display="none"))
 
         # self._year_slider, year_slider_box = self._create_year_slider(
         #     min(df['Year']), max(df['Year'])
@@ -526,17 +1102,17 @@ class BehavPlot(Observer):
         _app_container = widgets.VBox([
             self._age_dropdown, self._sex_dropdown,
             widgets.HBox([self._x_dropdown, self._y_dropdown]),
-            self._checkbox,
+            widgets.HBox([self._checkbox, self._corr_checkbox]),
             self._figure,
+            self._corr_figure,
             # year_slider_box
         ], layout=widgets.Layout(align_items='center', flex='3 0 auto'))
-        self.container = widgets.VBox([
+        return widgets.VBox([
             widgets.HBox([
                 _app_container,
             ])
         ], layout=widgets.Layout(flex='1 1 auto', margin='0 auto 0 auto', max_width='1024px'))
         
-        self._update_app()
 
     # @classmethod
     # def from_csv(cls, path):
@@ -560,7 +1136,22 @@ class BehavPlot(Observer):
         return checkbox
 
     def _on_change(self, _):
-        self._update_app()
+        self._request_update(debounce=True)
+
+    def set_features(self, features):
+        '''
+        Add per-subject tract features to the measures that can be plotted,
+        for the subjects of the behavioural data that have them.
+
+        Parameters
+        -----------
+        features : features.FeatureTable, or None to remove the features
+        '''
+        self._features = features
+        if self._container is not None and 'Subject' in self._df:
+            with self.hold_updates():
+                self._new_data_reset()
+                self._request_update()
     
     def update(self, data):
         '''
@@ -569,71 +1160,39 @@ class BehavPlot(Observer):
 
         Parameters
         -----------
-        data : csv in bytes, use pd.read_csv(data)
+        data : dataset.Dataset, shared by all observers and read-only
         '''
-        #df = pd.read_csv(data)
-        #self._df = df
-        self._df = data
-        #print(self._df)
-        self._new_data_reset()
-        
-        self._update_app()
+        with self.hold_updates():
+            self._df = data.project(self.columns)
+            self._new_data_reset()
+            self._request_update()
     
     def _update_app(self):
-        
-        x_measure = self._x_dropdown.value
-        y_measure = self._y_dropdown.value
-        #print(self._df.head())
-        #print(self._x_dropdown.options)
-        #print(self._y_dropdown.options)
-        # year_range = self._year_slider.value
-
-        showreg = self._checkbox.value
-
-        with self._scatter.hold_sync():          
-            with self._line.hold_sync():
-            
-            
-                x = self._df[x_measure]
-                #print(x_measure)
-                #print(y_measure)
-                y = self._df[y_measure]
-
-                #print(x.head())
-                #print(y.head())
-
-                        
-                x_scale = LinearScale()
-                y_scale = LinearScale()
-        
-                self._x_axis = Axis(scale=x_scale, label="X")
-                self._y_axis = Axis(scale=y_scale, orientation="vertical", label="Y", label_offset = '3.9em')
-        
-                self._scatter.scales = {"x": x_scale, "y": y_scale}
-                
-                        
-                self._x_axis.label = x_measure
-                self._y_axis.label = y_measure
-                
-                self._scatter.default_opacities = [0.5]
-    
-                self._scatter.x = x
-                self._scatter.y = y
-
-                #print(self._scatter)
-            
-
-                if showreg:
-                    self._line.x = [np.min(x), np.max(x)]
-                    poly = np.polyfit(self._scatter.x, self._scatter.y, 1)
-                    self._line.y = np.polyval(poly, self._line.x)
-    
-                if showreg == False:
-                    self._line.x = []
-                    self._line.y = []
-                self._line.scales= {"x": x_scale, "y": y_scale}
-                self._figure.axes =[self._x_axis, self._y_axis]
-                self._figure.animation_duration=500
+        filters = dict(Age=self._age_dropdown.value, Gender=self._sex_dropdown.value)
+        view = self._model.render(self._x_dropdown.value, self._y_dropdown.value, filters,
+                                  line=self._checkbox.value, correlation=self._corr_checkbox.value,
+                                  **self.lod)
+
+        self._push(self._x_axis, label=view['x_label'])
+        self._push(self._y_axis, label=view['y_label'])
+        self._show_points(view['points'])
+        self._push(self._line, x=view['line_x'], y=view['line_y'])
+
+        corr = view['corr']
+        if corr is not None:
+            self._push(self._corr_map, row=corr['names'], column=corr['names'], color=corr['values'])
+        self._push(self._corr_figure.layout, display=None if corr is not None else 'none')
+
+    def _on_corr_select(self, change):
+        '''
+        Plot the pair of measures of the clicked correlation matrix cell.
+        '''
+        if change['new'] is None or len(change['new']) == 0:
+            return
+        row, column = change['new'][0]
+        with self.hold_updates():
+            self._x_dropdown.value = self._measures[column]
+            self._y_dropdown.value = self._measures[row]
 
     def _new_data_reset(self):
         '''
@@ -641,18 +1200,22 @@ class BehavPlot(Observer):
         Gets called by the observer update function when new data
         are loaded via the File Loader.
         '''
-        df = self._df #set new dta
-        
-        self._df = df[['Subject','Age','Gender','PicSeq_AgeAdj','CardSort_AgeAdj','Flanker_AgeAdj','ListSort_AgeAdj','ReadEng_AgeAdj','PicVocab_AgeAdj','ProcSpeed_AgeAdj', 'FS_TotCort_GM_Vol','FS_SubCort_GM_Vol','FS_Total_GM_Vol','FS_L_WM_Vol','FS_R_WM_Vol',	'FS_Tot_WM_Vol']].dropna(how='any')
-
         #set new dropdown options
         # available_indicators = self._df['Indicator Name'].unique()
         # self._x_dropdown.options = available_indicators
         # self._x_dropdown.value = available_indicators[0]
         
-        self._measures = self._df.columns[3:]
-        age_options = ['All Ages'] + list(self._df['Age'].unique())
-        sex_options = ['All'] + list(self._df['Gender'].unique())
+        self._measures = pd.Index([c for c in self.measures if c in self._df])
+        if self._features is None:
+            self._model = models.BehavModel(self._df, self._measures)
+        else:
+            rows, values, names = self._features.join(self._df, self._measures)
+            self._measures = pd.Index(names)
+            filters = pd.DataFrame({name: self._df[name].iloc[rows] for name in ('Age', 'Gender') if name in self._df},
+                                   index=self._df.index[rows])
+            self._model = models.BehavModel(filters, self._measures, values=values)
+        age_options = ['All Ages'] + self._model.filter_values('Age')
+        sex_options = ['All'] + self._model.filter_values('Gender')
         
         self._x_dropdown.options = self._measures
         self._x_dropdown.value = self._measures[0]
@@ -662,4 +1225,73 @@ class BehavPlot(Observer):
         
         self._age_dropdown.options =  age_options
         self._sex_dropdown.options = sex_options
-        
\ No newline at end of file
+
+
+class SliceViewer(Redrawable):
+    '''
+    Interactive slices of a volume: pick an axis and scrub through it.
+
+    Slices are read from a slices.SliceStore at about the display size, so
+    only a slice-sized array is read from disk and sent to the browser.
+    '''
+
+    display_size = 256 #pixels
+
+    def __init__(self, store):
+        '''
+        Parameters
+        -----------
+        store : slices.SliceStore
+        '''
+        self._store = store
+
+    @classmethod
+    def from_nifti(cls, path, volume=0):
+        '''
+        View a NIfTI file (see slices.SliceStore.from_nifti).
+        '''
+        return cls(slices.SliceStore.from_nifti(path, volume=volume))
+
+    def _build_widgets(self):
+        self._axis_toggle = widgets.ToggleButtons(options=list(slices.AXES), value='axial')
+        self._axis_toggle.observe(self._on_axis_change, names=['value'])
+        self._index_slider = widgets.IntSlider(min=0, max=self._store.shape[2] - 1,
+                                               value=self._store.shape[2] // 2,
+                                               description='slice', continuous_update=True)
+        self._index_slider.observe(self._on_change, names=['value'])
+
+        x_scale = bqplot.LinearScale()
+        y_scale = bqplot.LinearScale()
+        low, high = self._store.value_range
+        self._slice_map = bqplot.HeatMap(x=np.arange(2), y=np.arange(2), color=np.zeros((2, 2)),
+                                         scales={'x': x_scale, 'y': y_scale,
+                                                 'color': bqplot.ColorScale(scheme='Greys', reverse=True,
+                                                                            min=low, max=high)})
+        self._figure = bqplot.Figure(marks=[self._slice_map], padding_x=0, padding_y=0,
+                                     fig_margin=dict(top=10, bottom=10, left=10, right=10),
+                                     layout=dict(width=f'{self.display_size + 20}px',
+                                                 height=f'{self.display_size + 20}px'))
+
+        return widgets.VBox([self._axis_toggle, self._index_slider, self._figure],
+                            layout=widgets.Layout(align_items='center'))
+
+    def _on_axis_change(self, change):
+        axis = slices.AXES[change['new']]
+        with self.hold_updates():
+            self._index_slider.max = self._store.shape[axis] - 1
+            self._index_slider.value = self._store.shape[axis] // 2
+            self._request_update()
+
+    def _on_change(self, _):
+        self._request_update(debounce=True)
+
+    def _update_app(self):
+        view = self._store.slice(self._axis_toggle.value, self._index_slider.value, self.display_size)
+        image = view['image']
+        dx, dy = view['spacing']
+        x = np.arange(image.shape[0]) * dx
+        y = np.arange(image.shape[1]) * dy
+        # rows of the heat map are y; keep the voxels square on screen
+        ratio = (image.shape[0] * dx) / (image.shape[1] * dy)
+        self._push(self._slice_map, x=x, y=y, color=image.T)
+        self._push(self._figure, min_aspect_ratio=ratio, max_aspect_ratio=ratio)
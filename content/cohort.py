@@ -0,0 +1,279 @@
+"""Cohort-level storage of AFQ tract profiles.
+
+Profiles from many subjects are packed into one dense float32 array of shape
+(subject, tract, node, measure). On disk it is a ``profiles.npy`` file next to
+a small ``index.json`` that names the labels along each axis. The array is
+opened as a memory map, so opening a store is instant and only the parts that
+are actually looked at get read from disk.
+
+CohortStats keeps streaming statistics of a cohort (mean, variance and
+quantiles per tract and node), which TractPlot draws as bands behind one
+subject's profile.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiles import MEASURES, fill_block
+
+
+DATA_FILE = 'profiles.npy'
+INDEX_FILE = 'index.json'
+
+
+class CohortStore:
+    '''
+    A subject x tract x node x measure array of tract profiles.
+
+    Use CohortStore.build to ingest a set of *_desc-prob-afq_profiles.csv
+    files, and CohortStore.open to open a store that was built before.
+    '''
+
+    def __init__(self, data, subjects, tracts, nodes, measures):
+        self.data = data
+        self.subjects = list(subjects)
+        self.tracts = list(tracts)
+        self.nodes = np.asarray(nodes)
+        self.measures = list(measures)
+        self._subject_index = {sub: i for i, sub in enumerate(self.subjects)}
+
+    @classmethod
+    def build(cls, profiles, directory, tracts=None, measures=MEASURES):
+        '''
+        Ingest per-subject profiles files into a new store.
+
+        Files are read one at a time, so memory use does not grow with the
+        number of subjects. Values that are missing from a file are NaN.
+
+        Parameters
+        -----------
+        profiles : dict mapping subject ID to the path of its profiles CSV
+        directory : directory the store is written to
+        tracts : list of tract names; by default the tracts of the first file
+        measures : list of measure columns to keep
+        '''
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        profiles = dict(profiles)
+        subjects = [str(sub) for sub in profiles]
+
+        data = None
+        for i, path in enumerate(profiles.values()):
+            df = pd.read_csv(path, usecols=['tractID', 'nodeID'] + list(measures))
+            if data is None:
+                if tracts is None:
+                    tracts = list(pd.unique(df['tractID']))
+                nodes = np.sort(pd.unique(df['nodeID']))
+                shape = (len(subjects), len(tracts), len(nodes), len(measures))
+                data = np.lib.format.open_memmap(directory / DATA_FILE, mode='w+',
+                                                 dtype=np.float32, shape=shape)
+                data[:] = np.nan
+
+            fill_block(data[i], df, tracts, nodes, measures)
+
+        if data is None:
+            raise ValueError("No profiles files were given")
+        data.flush()
+
+        index = {'subjects': subjects,
+                 'tracts': list(tracts),
+                 'nodes': nodes.tolist(),
+                 'measures': list(measures)}
+        with open(directory / INDEX_FILE, 'w') as f:
+            json.dump(index, f)
+
+        return cls.open(directory)
+
+    @classmethod
+    def open(cls, directory, mode='r'):
+        '''
+        Open an existing store as a memory map.
+
+        Parameters
+        -----------
+        directory : directory the store was written to
+        mode : memory map mode, 'r' (read-only) or 'r+' (read-write)
+        '''
+        directory = Path(directory)
+        with open(directory / INDEX_FILE) as f:
+            index = json.load(f)
+        data = np.load(directory / DATA_FILE, mmap_mode=mode)
+        return cls(data, index['subjects'], index['tracts'], index['nodes'], index['measures'])
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def subject(self, subject):
+        '''Tract x node x measure block of one subject (a view).'''
+        return self.data[self._subject_index[str(subject)]]
+
+    def profile(self, subject, tract, measure):
+        '''Profile of one measure along one tract of one subject (a view).'''
+        return self.data[self._subject_index[str(subject)],
+                         self.tracts.index(tract), :,
+                         self.measures.index(measure)]
+
+
+# value range of the quantile sketch of each measure; values outside are
+# counted in the first or last bin
+RANGES = {'dki_fa': (0.0, 1.0), 'dki_md': (0.0, 0.004),
+          'dki_mk': (0.0, 3.0), 'dki_awf': (0.0, 1.0)}
+
+
+class CohortStats:
+    '''
+    Per-tract, per-node statistics of a cohort, updated one subject at a time.
+
+    Mean and variance are kept with Welford's algorithm, and quantiles are
+    estimated from a fixed-bin histogram of every tract x node x measure.
+    Memory use does not depend on the number of subjects, and statistics
+    built on separate parts of a cohort (e.g. by separate workers) can be
+    merged into the statistics of the whole cohort.
+    '''
+
+    def __init__(self, tracts, nodes, measures=MEASURES, bins=200, ranges=None):
+        '''
+        Parameters
+        -----------
+        tracts : list of tract names
+        nodes : 1D array of node ids
+        measures : list of measure names
+        bins : number of histogram bins per measure, for the quantiles
+        ranges : dict mapping measure names to the (low, high) range of
+            their histogram; defaults to RANGES, or to (0, 1)
+        '''
+        self.tracts = list(tracts)
+        self.nodes = np.asarray(nodes)
+        self.measures = list(measures)
+        ranges = dict(RANGES, **(ranges or {}))
+        self.ranges = np.array([ranges.get(m, (0.0, 1.0)) for m in self.measures], dtype=np.float64)
+        self.bins = bins
+
+        shape = (len(self.tracts), len(self.nodes), len(self.measures))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self._m2 = np.zeros(shape, dtype=np.float64)
+        self.histogram = np.zeros(shape + (bins,), dtype=np.int32)
+
+    @classmethod
+    def from_profiles(cls, profiles, tracts, nodes, measures=MEASURES, **kwargs):
+        '''
+        Statistics of many subjects' profiles files, read one at a time.
+
+        Parameters
+        -----------
+        profiles : iterable of paths of profiles CSV files
+        tracts, nodes, measures, kwargs : see CohortStats
+        '''
+        stats = cls(tracts, nodes, measures, **kwargs)
+        for path in profiles:
+            stats.add_frame(pd.read_csv(path, usecols=['tractID', 'nodeID'] + stats.measures))
+        return stats
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        "Statistics of all the subjects of a CohortStore."
+        stats = cls(store.tracts, store.nodes, store.measures, **kwargs)
+        for i in range(len(store)):
+            stats.add(store.data[i])
+        return stats
+
+    def add_frame(self, df):
+        "Add one subject's profiles, as a DataFrame with tractID, nodeID and measure columns."
+        block = np.full(self.count.shape, np.nan, dtype=np.float32)
+        fill_block(block, df, self.tracts, self.nodes, self.measures)
+        self.add(block)
+
+    def add(self, block):
+        '''
+        Add one subject, as a tract x node x measure block such as
+        CohortStore.subject(subject). NaN values are skipped.
+        '''
+        x = np.asarray(block, dtype=np.float64)
+        valid = np.isfinite(x)
+        x = np.where(valid, x, 0.0)
+
+        self.count += valid
+        delta = np.where(valid, x - self.mean, 0.0)
+        self.mean += np.divide(delta, self.count, out=np.zeros_like(delta), where=valid)
+        self._m2 += delta * (x - self.mean) * valid
+
+        low, high = self.ranges[:, 0], self.ranges[:, 1]
+        b = np.floor((x - low) / (high - low) * self.bins).astype(np.int64)
+        b = np.clip(b, 0, self.bins - 1)
+        cells = np.flatnonzero(valid)
+        self.histogram.reshape(-1, self.bins)[cells, b.ravel()[cells]] += 1
+
+    def merge(self, other):
+        '''
+        Add the subjects counted by other, statistics of the same tracts,
+        nodes, measures and histogram bins (Chan et al.'s parallel update).
+        '''
+        if (other.tracts != self.tracts or other.measures != self.measures
+                or not np.array_equal(other.nodes, self.nodes) or other.bins != self.bins
+                or not np.array_equal(other.ranges, self.ranges)):
+            raise ValueError("Cannot merge statistics of different layouts")
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(count > 0, other.count / count, 0.0)
+        self.mean = self.mean + delta * weight
+        self._m2 = self._m2 + other._m2 + delta ** 2 * self.count * weight
+        self.count = count
+        self.histogram += other.histogram
+        return self
+
+    @property
+    def variance(self):
+        "Sample variance; NaN where fewer than two subjects have a value."
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 1, self._m2 / (self.count - 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def quantile(self, q, tract=None, measure=None):
+        '''
+        Approximate q-th quantile (0 <= q <= 1), interpolated within the
+        histogram bins, for every tract x node x measure, or for the nodes
+        of one tract and measure. NaN where no subject has a value.
+        '''
+        histogram = self.histogram
+        ranges = self.ranges
+        if tract is not None:
+            histogram = histogram[self.tracts.index(tract)]
+        if measure is not None:
+            m = self.measures.index(measure)
+            histogram = histogram[..., m, :]
+            ranges = ranges[m]
+        low, high = ranges[..., 0], ranges[..., 1]
+
+        cumulative = np.cumsum(histogram, axis=-1)
+        total = cumulative[..., -1]
+        target = q * total
+        b = np.minimum((cumulative < target[..., None]).sum(axis=-1), self.bins - 1)
+        before = np.where(b > 0, np.take_along_axis(cumulative, np.maximum(b - 1, 0)[..., None], -1)[..., 0], 0)
+        inside = np.take_along_axis(histogram, b[..., None], -1)[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.clip(np.where(inside > 0, (target - before) / inside, 0.0), 0, 1)
+        width = (high - low) / self.bins
+        return np.where(total > 0, low + (b + fraction) * width, np.nan)
+
+    def bands(self, tract, measure, quantiles=(0.05, 0.95)):
+        '''
+        What the cohort bands of one tract and measure are drawn from.
+
+        Returns
+        -----------
+        dict with nodes, mean, std and quantiles (a list of arrays, one
+        per requested quantile), each along the nodes of the tract
+        '''
+        t = self.tracts.index(tract)
+        m = self.measures.index(measure)
+        return {'nodes': self.nodes,
+                'mean': self.mean[t, :, m],
+                'std': self.std[t, :, m],
+                'quantiles': [self.quantile(q, tract, measure) for q in quantiles]}
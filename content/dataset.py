@@ -0,0 +1,116 @@
+"""Shared, read-only dataset handed from the file loader to the plots.
+
+The file loader parses an upload once and wraps the table in a Dataset. The
+same Dataset is passed to every observer. Observers ask it for read-only
+columns or projections instead of copying the table, and identical requests
+from different observers share the same read-only arrays.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _read_only(values):
+    "Read-only view of a NumPy array or categorical; other arrays are copied."
+    if isinstance(values, pd.Categorical):
+        # the codes property is a read-only view of the codes
+        return pd.Categorical.from_codes(values.codes, dtype=values.dtype)
+    if isinstance(values, np.ndarray):
+        values = values.view()
+        values.flags.writeable = False
+        return values
+    return values.copy()
+
+
+class Dataset:
+    '''
+    Immutable wrapper around a parsed DataFrame.
+
+    Columns are returned as read-only NumPy arrays, and the columns of
+    projections (optionally restricted to complete rows) are computed once
+    and shared.
+    Call release() when the dataset is replaced, to drop the table and
+    everything derived from it.
+    '''
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def frame(self):
+        '''The underlying DataFrame. Observers must not modify it.'''
+        if self._frame is None:
+            raise ValueError("Dataset has been released")
+        return self._frame
+
+    @property
+    def columns(self):
+        return list(self.frame.columns)
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def column(self, name):
+        '''
+        Values of one column as a read-only NumPy array or categorical,
+        sharing the memory of the table. Other extension arrays (e.g.
+        nullable integers) come as a copy.
+        '''
+        def compute():
+            values = self.frame[name].array
+            if isinstance(values, pd.arrays.PandasArray):
+                values = values.to_numpy()
+            return _read_only(values)
+        return self._cached(('column', name), compute)
+
+    def complete(self, columns):
+        '''Read-only boolean mask of the rows with no missing value in columns.'''
+        columns = tuple(c for c in columns if c in self.frame.columns)
+        def compute():
+            mask = self.frame[list(columns)].notna().all(axis=1).to_numpy()
+            mask.flags.writeable = False
+            return mask
+        return self._cached(('complete', columns), compute)
+
+    def project(self, columns, dropna=False):
+        '''
+        Shared projection of the given columns.
+
+        Parameters
+        -----------
+        columns : iterable of column names; names not in the data are skipped
+        dropna : if True, only keep rows that are complete in these columns
+
+        Returns
+        -----------
+        a new pd.DataFrame over read-only column arrays that are shared by
+        every caller asking for the same projection. Nothing is copied
+        unless rows are dropped, and writing to the arrays raises a
+        ValueError. Selecting several columns at once (frame[list]) makes
+        pandas consolidate them into a writable copy, private to that
+        DataFrame: use the columns one at a time to avoid the copy.
+        '''
+        columns = tuple(c for c in columns if c in self.frame.columns)
+        def compute():
+            index = self.frame.index
+            arrays = {name: self.column(name) for name in columns}
+            if dropna:
+                mask = self.complete(columns)
+                if not mask.all():
+                    index = index[mask]
+                    arrays = {name: _read_only(values[mask]) for name, values in arrays.items()}
+            return index, arrays
+        index, arrays = self._cached(('project', columns, dropna), compute)
+        # a new DataFrame each time: pandas consolidates a DataFrame's
+        # columns in place, which would give later callers a writable copy
+        return pd.DataFrame(arrays, index=index, copy=False)
+
+    def release(self):
+        '''Drop the table and all cached columns and projections.'''
+        self._cache.clear()
+        self._frame = None
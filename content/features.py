@@ -0,0 +1,229 @@
+"""Per-subject feature matrix of tract summaries, joined to behavioural scores.
+
+Each subject's tract profiles are reduced to one value per tract and measure
+(the mean along the tract, and optionally the means over node ranges), and its
+streamline counts are added. Subjects are the rows of one float32 matrix, kept
+on disk next to an index of the subjects, the feature names and the files each
+row was computed from. Adding subjects only reads their own files: rows of
+subjects whose files did not change are kept as they are.
+
+FeatureTable.join lines the rows up with an uploaded behavioural table through
+its Subject column, giving one contiguous float32 matrix of behavioural
+measures and tract features that BehavPlot can plot against each other.
+"""
+import json
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiles import MEASURES, TRACTS, fill_block
+
+
+CACHE_DIR = Path('/tmp/cache/features')
+
+DATA_FILE = 'features.npy'
+INDEX_FILE = 'index.json'
+
+SL_COLUMNS = ['n_streamlines', 'n_streamlines_clean']
+
+
+def _signature(path):
+    "Size and modification time of a file, to tell whether it changed."
+    stat = os.stat(path)
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+class FeatureTable:
+    '''
+    Subject x feature matrix of tract-level summaries.
+
+    Features are named '<tract>_<measure>' for the mean of a measure along a
+    tract (e.g. 'ARC_L_dki_fa'), '<tract>_<measure>_<start>-<stop>' for its
+    mean over nodes start <= node < stop, and '<tract>_<count>' for the
+    streamline counts (e.g. 'ARC_L_n_streamlines'). Values a subject does
+    not have are NaN.
+
+    Use FeatureTable.open to open a table saved before (or a new one), add
+    subjects with update, then save.
+    '''
+
+    def __init__(self, directory=CACHE_DIR, tracts=TRACTS, measures=MEASURES,
+                 node_ranges=(), sl_count=SL_COLUMNS):
+        '''
+        Parameters
+        -----------
+        directory : directory the table is saved to
+        tracts : list of tract names
+        measures : list of profile measures to summarise
+        node_ranges : list of (start, stop) node ranges to average over,
+            in addition to the whole tract
+        sl_count : list of streamline count columns to add
+        '''
+        self.directory = Path(directory)
+        self.tracts = list(tracts)
+        self.measures = list(measures)
+        self.node_ranges = [tuple(r) for r in node_ranges]
+        self.sl_count = list(sl_count)
+
+        self.columns = [f'{t}_{m}' + ''.join(suffix)
+                        for t in self.tracts for m in self.measures
+                        for suffix in [()] + [(f'_{start}-{stop}',) for start, stop in self.node_ranges]]
+        self.columns += [f'{t}_{c}' for t in self.tracts for c in self.sl_count]
+
+        self.subjects = []
+        self._rows = {}
+        self._sources = {}
+        self._data = np.empty((0, len(self.columns)), dtype=np.float32)
+
+    @classmethod
+    def open(cls, directory=CACHE_DIR, **kwargs):
+        '''
+        Open the table saved in directory. If there is none, or it was
+        saved with other tracts, measures, node ranges or counts, a new
+        empty table is returned.
+
+        Parameters
+        -----------
+        directory : directory the table was saved to
+        kwargs : layout of the table, see FeatureTable
+        '''
+        table = cls(directory, **kwargs)
+        try:
+            with open(table.directory / INDEX_FILE) as f:
+                index = json.load(f)
+            data = np.load(table.directory / DATA_FILE)
+        except (OSError, ValueError):
+            return table
+        if index['columns'] != table.columns or data.shape != (len(index['subjects']), len(table.columns)):
+            return table
+        table.subjects = index['subjects']
+        table._rows = {sub: i for i, sub in enumerate(table.subjects)}
+        table._sources = index['sources']
+        table._data = data.astype(np.float32, copy=False)
+        return table
+
+    def save(self):
+        '''Write the table to its directory.'''
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f'{DATA_FILE}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, self.values)
+        tmp.replace(self.directory / DATA_FILE)
+        tmp = self.directory / f'{INDEX_FILE}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'subjects': self.subjects, 'columns': self.columns, 'sources': self._sources}, f)
+        tmp.replace(self.directory / INDEX_FILE)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def __contains__(self, subject):
+        return str(subject) in self._rows
+
+    @property
+    def values(self):
+        '''Subject x feature float32 array (a view).'''
+        return self._data[:len(self.subjects)]
+
+    def row(self, subject):
+        '''Features of one subject (a view).'''
+        return self.values[self._rows[str(subject)]]
+
+    def update(self, files):
+        '''
+        Add or refresh the rows of some subjects. Subjects whose files did
+        not change since their row was computed, and subjects with neither
+        file, are skipped.
+
+        Parameters
+        -----------
+        files : dict mapping subject IDs to {'profiles': path,
+            'sl_count': path}, as returned by fetch.fetch_subjects;
+            either file can be missing
+
+        Returns
+        -----------
+        list of the subjects whose rows were (re)computed
+        '''
+        changed = []
+        for sub, paths in files.items():
+            sub = str(sub)
+            sources = {name: _signature(path) for name, path in paths.items()
+                       if name in ('profiles', 'sl_count')}
+            if not sources or (sub in self._rows and self._sources.get(sub) == sources):
+                continue
+            self._set(sub, self._summarise(paths.get('profiles'), paths.get('sl_count')))
+            self._sources[sub] = sources
+            changed.append(sub)
+        return changed
+
+    def _set(self, subject, row):
+        if subject not in self._rows:
+            n = len(self.subjects)
+            if n == len(self._data):
+                # grow geometrically, so adding subjects one at a time is amortised O(1)
+                grown = np.empty((max(2 * n, 64), len(self.columns)), dtype=np.float32)
+                grown[:n] = self._data[:n]
+                self._data = grown
+            self._rows[subject] = n
+            self.subjects.append(subject)
+        self._data[self._rows[subject]] = row
+
+    def _summarise(self, profiles, sl_count):
+        '''One subject's row, from the paths of its profiles and streamline count files.'''
+        row = np.full(len(self.columns), np.nan, dtype=np.float32)
+        n_profiles = len(self.tracts) * len(self.measures) * (1 + len(self.node_ranges))
+
+        if profiles is not None:
+            df = pd.read_csv(profiles, usecols=lambda name: name in {'tractID', 'nodeID', *self.measures})
+            df = df.reindex(columns=['tractID', 'nodeID'] + self.measures)
+            nodes = np.sort(pd.unique(df['nodeID']))
+            block = np.full((len(self.tracts), len(nodes), len(self.measures)), np.nan, dtype=np.float32)
+            fill_block(block, df, self.tracts, nodes, self.measures)
+            means = [block] + [block[:, (nodes >= start) & (nodes < stop)] for start, stop in self.node_ranges]
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning) # mean of no values is NaN
+                means = np.stack([np.nanmean(part, axis=1) for part in means], axis=-1)
+            row[:n_profiles] = means.ravel()
+
+        if sl_count is not None:
+            df = pd.read_csv(sl_count, index_col=0)
+            counts = df.reindex(index=self.tracts, columns=self.sl_count)
+            row[n_profiles:] = counts.to_numpy(dtype=np.float64).ravel()
+        return row
+
+    def join(self, frame, columns, on='Subject', dropna=False):
+        '''
+        Line the features up with the rows of a table, such as the
+        behavioural table, through its subject ID column. Rows of subjects
+        that are not in the table are left out.
+
+        Parameters
+        -----------
+        frame : pd.DataFrame with a subject ID column
+        columns : columns of frame to put before the features
+        on : name of the subject ID column
+        dropna : if True, also leave out the rows with a missing value
+
+        Returns
+        -----------
+        (rows, values, names): positions of the kept rows of frame, a
+        C-contiguous float32 array with one row per kept row and the
+        given columns followed by the features, and the names of its
+        columns
+        '''
+        columns = list(columns)
+        positions = pd.Index(self.subjects).get_indexer(frame[on].astype(str))
+        rows = np.flatnonzero(positions >= 0)
+
+        values = np.empty((len(rows), len(columns) + len(self.columns)), dtype=np.float32)
+        for i, name in enumerate(columns): #one at a time, so frame is not consolidated into a copy
+            values[:, i] = frame[name].to_numpy(dtype=np.float32)[rows]
+        np.take(self.values, positions[rows], axis=0, out=values[:, len(columns):])
+        if dropna:
+            complete = ~np.isnan(values).any(axis=1)
+            rows, values = rows[complete], np.ascontiguousarray(values[complete])
+        return rows, values, columns + self.columns
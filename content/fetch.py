@@ -0,0 +1,252 @@
+"""Bulk download of per-subject AFQ derivatives into a local cache.
+
+Files are fetched through a bounded thread pool. Each worker thread keeps one
+HTTP connection per host open and reuses it for all of its requests. Downloads
+are stored in a content-addressed cache (objects are named by the SHA-256 of
+their bytes), and files that are already in the cache are not fetched again.
+"""
+import hashlib
+import http.client
+import json
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+
+BASE_URL = 'https://open-neurodata.s3.amazonaws.com/rokem/hcp1200/afq'
+
+DERIVATIVES = {
+    'profiles': 'sub-{sub}/ses-01/sub-{sub}_dwi_space-RASMM_model-CSD_desc-prob-afq_profiles.csv',
+    'sl_count': 'sub-{sub}/ses-01/sub-{sub}_dwi_space-RASMM_model-CSD_desc-prob-afq_sl_count.csv',
+}
+
+CACHE_DIR = Path('/tmp/cache/afq')
+
+
+class FileCache:
+    '''
+    Content-addressed store of downloaded files.
+
+    Objects are saved under objects/<hash[:2]>/<hash[2:]>, and refs.json maps
+    each key to the object hash. fetch_subjects uses the full URL of a file
+    (base URL and object key) as its key, so files of different sources are
+    never mixed up. Identical files downloaded under different keys are
+    stored once.
+    '''
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = Path(directory)
+        self._refs_path = self.directory / 'refs.json'
+        self._lock = threading.Lock()
+        if self._refs_path.exists():
+            with open(self._refs_path) as f:
+                self._refs = json.load(f)
+        else:
+            self._refs = {}
+
+    def _object_path(self, digest):
+        return self.directory / 'objects' / digest[:2] / digest[2:]
+
+    def get(self, key):
+        '''Local path of the cached object for key, or None if it is not cached.'''
+        digest = self._refs.get(key)
+        if digest is None:
+            return None
+        path = self._object_path(digest)
+        return path if path.exists() else None
+
+    def put(self, key, content):
+        '''Store content (bytes) under key and return its local path.'''
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp.write_bytes(content)
+            tmp.replace(path)
+        with self._lock:
+            self._refs[key] = digest
+        return path
+
+    def save(self):
+        '''Write the key index to disk.'''
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp = self._refs_path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self._refs, f)
+            tmp.replace(self._refs_path)
+
+
+class Fetcher:
+    '''
+    Reads and lists object keys relative to a base URL.
+
+    The base URL can be an http(s) URL, a file:// URL or a local directory,
+    which makes it easy to point the fetcher at a mirror or at test data.
+    '''
+
+    def __init__(self, base_url=BASE_URL, retries=3, timeout=30):
+        self.base_url = str(base_url).rstrip('/')
+        self.retries = retries
+        self.timeout = timeout
+        parts = urlsplit(self.base_url)
+        self._scheme = parts.scheme if parts.scheme in ('http', 'https', 'file') else ''
+        self._local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _root(self):
+        "Local directory of a file:// or directory base URL."
+        return Path(urlsplit(self.base_url).path if self._scheme else self.base_url)
+
+    def _get(self, url):
+        '''
+        GET an http(s) URL and return the response body, or None on 403/404.
+        Connection errors and server errors are retried with backoff.
+        '''
+        parts = urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self._connection(parts.scheme, parts.netloc)
+                conn.request('GET', target)
+                response = conn.getresponse()
+                content = response.read()
+            except (OSError, http.client.HTTPException):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status == 200:
+                    return content
+                if response.status in (403, 404):
+                    return None
+                if response.status < 500 or attempt == self.retries:
+                    raise OSError(f"GET {parts.geturl()} failed with status {response.status}")
+            time.sleep(0.5 * 2 ** attempt)
+
+    def read(self, key):
+        '''
+        Return the bytes of the object at key, or None if it does not exist.
+        Connection errors and server errors are retried with backoff.
+        '''
+        if not self._scheme or self._scheme == 'file':
+            path = self._root() / key
+            return path.read_bytes() if path.exists() else None
+        return self._get(f'{self.base_url}/{key}')
+
+    def list(self, prefix=''):
+        '''
+        Yield (key, size, etag) for every object whose key starts with prefix.
+
+        Over http(s), the base URL must be an S3 bucket URL (such as
+        BASE_URL), listed with ListObjectsV2, 1000 keys per request. In a
+        local directory, the etag is made of the file's size and
+        modification time, so that it changes when the file does.
+        '''
+        if not self._scheme or self._scheme == 'file':
+            root = self._root()
+            start = root / prefix if prefix.endswith('/') or not prefix else (root / prefix).parent
+            if not start.is_dir():
+                return
+            for path in sorted(start.rglob('*')):
+                key = path.relative_to(root).as_posix()
+                if key.startswith(prefix) and path.is_file():
+                    stat = path.stat()
+                    yield key, stat.st_size, f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+            return
+
+        parts = urlsplit(self.base_url)
+        base = parts.path.strip('/')
+        base = f'{base}/' if base else ''
+        ns = {'s3': 'http://s3.amazonaws.com/doc/2006-03-01/'}
+        token = None
+        while True:
+            query = f'list-type=2&prefix={quote(base + prefix)}'
+            if token is not None:
+                query += f'&continuation-token={quote(token)}'
+            content = self._get(f'{parts.scheme}://{parts.netloc}/?{query}')
+            if content is None:
+                raise OSError(f"Cannot list {self.base_url}")
+            listing = ET.fromstring(content)
+            for item in listing.iterfind('s3:Contents', ns):
+                key = item.findtext('s3:Key', namespaces=ns)[len(base):]
+                yield (key, int(item.findtext('s3:Size', namespaces=ns)),
+                       item.findtext('s3:ETag', default='', namespaces=ns).strip('"'))
+            if listing.findtext('s3:IsTruncated', namespaces=ns) != 'true':
+                return
+            token = listing.findtext('s3:NextContinuationToken', namespaces=ns)
+
+
+def subject_keys(subject, derivatives=tuple(DERIVATIVES)):
+    "Returns {derivative: object key} for the given subject ID."
+    return {name: DERIVATIVES[name].format(sub=subject) for name in derivatives}
+
+
+def fetch_subjects(subjects, cache_dir=CACHE_DIR, base_url=BASE_URL,
+                   derivatives=tuple(DERIVATIVES), max_workers=8, retries=3, manifest=None):
+    '''
+    Download the given derivatives of many subjects into the local cache.
+
+    Parameters
+    -----------
+    subjects : iterable of subject IDs, e.g. ['100206', '996782']
+    cache_dir : directory of the content-addressed cache
+    base_url : http(s) URL, file:// URL or local directory holding sub-*/ folders
+    derivatives : names from DERIVATIVES to fetch for each subject
+    max_workers : number of concurrent downloads
+    retries : number of retries after a failed request
+    manifest : optional manifest.Manifest of base_url; keys that it does
+        not list are known not to exist and are not requested
+
+    Returns
+    -----------
+    dict mapping each subject ID to {derivative: local path}. Files that
+    do not exist at the source are left out.
+    '''
+    cache = FileCache(cache_dir)
+    fetcher = Fetcher(base_url, retries=retries)
+
+    paths = {}
+    missing = []
+    for sub in subjects:
+        sub = str(sub)
+        paths[sub] = {}
+        for name, key in subject_keys(sub, derivatives).items():
+            cached = cache.get(f'{fetcher.base_url}/{key}')
+            if cached is not None:
+                paths[sub][name] = cached
+            elif manifest is None or key in manifest:
+                missing.append((sub, name, key))
+
+    def download(item):
+        sub, name, key = item
+        content = fetcher.read(key)
+        return item, (None if content is None else cache.put(f'{fetcher.base_url}/{key}', content))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for (sub, name, _), path in pool.map(download, missing):
+                if path is not None:
+                    paths[sub][name] = path
+    finally:
+        cache.save()
+
+    return paths
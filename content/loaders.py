@@ -0,0 +1,325 @@
+"""Loading of CSV data with a columnar cache.
+
+The first time a CSV file is loaded, a typed Feather copy of the parsed table
+is written to the cache, keyed by the SHA-256 of the CSV bytes. Later loads of
+the same content read the Feather copy directly. Callers can ask for a subset
+of columns with their dtypes, so wide files are never parsed in full, and
+in-memory contents (such as uploads) are parsed in place, not copied. When
+pyarrow is not available, files are simply parsed as CSV, and so are the
+other sources pd.read_csv accepts (URLs, file-like objects and compressed
+files). iter_csv_cached parses in chunks, for callers that report progress
+or may stop early.
+
+The cache is for desktop sessions. pyarrow is not part of the browser
+environment (environment.yml), and the browser's file system is in memory, so
+there files are always parsed as CSV and nothing is written. The cache holds
+at most MAX_CACHE_BYTES: the least recently used copies are removed first.
+
+compact_frame shrinks parsed tables to the smallest dtypes that hold their
+values, which matters in the browser, where memory is tight.
+"""
+import hashlib
+import io
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+CACHE_DIR = Path('/tmp/cache/columnar')
+MAX_CACHE_BYTES = 512 * 2**20
+
+
+def _feather():
+    '''
+    Returns the pyarrow.feather module, or None if pyarrow is not installed
+    or in the browser, where the cache is not used.
+    '''
+    if sys.platform == 'emscripten':
+        return None
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return None
+    return feather
+
+
+def content_hash(data):
+    "Returns the hex SHA-256 digest of the given bytes-like object."
+    return hashlib.sha256(data).hexdigest()
+
+
+def _projection_key(columns):
+    "Returns a short digest identifying a column projection."
+    if isinstance(columns, dict):
+        spec = sorted((name, str(dtype)) for name, dtype in columns.items())
+    else:
+        spec = sorted(columns)
+    return hashlib.sha256(repr(spec).encode()).hexdigest()[:16]
+
+
+def _options_key(kwargs):
+    "Returns a short digest identifying the pd.read_csv arguments of a parse."
+    spec = sorted((name, repr(value)) for name, value in kwargs.items())
+    return hashlib.sha256(repr(spec).encode()).hexdigest()[:16]
+
+
+class _MemoryReader(io.RawIOBase):
+    '''
+    Read-only binary file over a bytes-like object, without copying it
+    (io.BytesIO copies memoryviews, such as uploaded file contents).
+    '''
+
+    def __init__(self, data):
+        self._data = memoryview(data).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), len(self._data) - self._position)
+        buffer[:n] = self._data[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._data)}[whence]
+        self._position = max(start + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def open_buffer(data):
+    "Returns a binary file reading the bytes-like object data in place."
+    return io.BufferedReader(_MemoryReader(data))
+
+
+_COMPRESSED = ('.gz', '.bz2', '.zip', '.xz', '.zst', '.tar')
+
+
+def _is_plain_path(source):
+    "True for the path of an uncompressed local file, False for URLs and file-like objects."
+    if not isinstance(source, (str, os.PathLike)) or '://' in str(source):
+        return False
+    return not str(source).lower().endswith(_COMPRESSED)
+
+
+def _prepare(source, columns, cache_dir, kwargs, digest=None):
+    '''
+    The bytes of source (None if it is neither bytes-like nor the path of
+    an uncompressed local file), the path of their Feather copy (None
+    without pyarrow or bytes) and the pd.read_csv arguments of the column
+    projection.
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = source
+    elif _is_plain_path(source):
+        data = Path(source).read_bytes()
+    else:
+        data = None
+
+    key = None if data is None else digest or content_hash(data)
+    if key is not None and kwargs:
+        key = f'{key}-{_options_key(kwargs)}'
+    if columns is not None:
+        if key is not None:
+            key = f'{key}-{_projection_key(columns)}'
+        wanted = set(columns)
+        kwargs['usecols'] = lambda name: name in wanted
+        if isinstance(columns, dict):
+            kwargs['dtype'] = {name: dtype for name, dtype in columns.items() if dtype is not None}
+
+    cached = None
+    if key is not None and _feather() is not None:
+        cached = Path(CACHE_DIR if cache_dir is None else cache_dir) / f'{key}.feather'
+    return data, cached, kwargs
+
+
+def _load(cached):
+    "Reads the Feather copy of a table, marking it as recently used."
+    try:
+        cached.touch()
+    except OSError:
+        pass #a read-only cache is just not evicted in order of use
+    return pd.read_feather(cached)
+
+
+def _store(df, cached):
+    "Writes the Feather copy of a parsed table, if there is a cache."
+    if cached is None:
+        return
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix('.tmp')
+        df.to_feather(tmp)
+        tmp.replace(cached)
+    except Exception:
+        # Tables that Arrow cannot represent are just not cached.
+        return
+    _evict(cached.parent, keep=cached)
+
+
+def _evict(directory, keep=None, max_bytes=None):
+    "Removes the least recently used Feather copies until the cache holds at most max_bytes."
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    files = []
+    for path in directory.glob('*.feather'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path != keep:
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def read_csv_cached(source, columns=None, cache_dir=None, **kwargs):
+    '''
+    Parse a CSV file, going through the columnar cache when possible.
+
+    When columns are given, only those columns are parsed. Requested
+    columns that are not in the file are left out of the result. The
+    cache key includes the projection and the pd.read_csv arguments, so
+    each projection and parse of a file is cached separately.
+
+    Parameters
+    -----------
+    source : path of a CSV file, or its content as a bytes-like object;
+        other sources of pd.read_csv (URLs, file-like objects, compressed
+        files) are parsed without the cache
+    columns : list of columns, or dict mapping columns to dtypes
+        (None to infer the dtype); None parses all columns
+    cache_dir : directory holding the Feather copies, by default CACHE_DIR
+    **kwargs : passed to pd.read_csv when the file has to be parsed
+
+    Returns
+    -----------
+    pd.DataFrame
+    '''
+    data, cached, kwargs = _prepare(source, columns, cache_dir, kwargs)
+    if data is None:
+        return pd.read_csv(source, **kwargs)
+    if cached is not None and cached.exists():
+        return _load(cached)
+
+    with open_buffer(data) as buffer:
+        df = pd.read_csv(buffer, **kwargs)
+    _store(df, cached)
+    return df
+
+
+def iter_csv_cached(source, columns=None, cache_dir=None, chunksize=50000, digest=None, **kwargs):
+    '''
+    Parse a CSV file in chunks of rows, like read_csv_cached. A file that
+    is in the columnar cache comes as one chunk. The cache is written once
+    the last chunk has been parsed, so stopping early caches nothing.
+
+    Parameters
+    -----------
+    source, columns, cache_dir, kwargs : see read_csv_cached
+    chunksize : number of rows per chunk
+    digest : content_hash of source, if the caller already has it
+
+    Yields
+    -----------
+    (chunk, done): a pd.DataFrame of the next rows, and the fraction of the
+    file parsed so far (0 until the last chunk for URLs and file-like
+    objects, whose size is not known)
+    '''
+    data, cached, kwargs = _prepare(source, columns, cache_dir, kwargs, digest)
+    if data is None:
+        with pd.read_csv(source, chunksize=chunksize, **kwargs) as reader:
+            chunk = None
+            for following in reader:
+                if chunk is not None:
+                    yield chunk, 0.0
+                chunk = following
+            if chunk is not None:
+                yield chunk, 1.0
+        return
+    if cached is not None and cached.exists():
+        yield _load(cached), 1.0
+        return
+
+    size = max(memoryview(data).nbytes, 1)
+    chunks = []
+    with open_buffer(data) as buffer, pd.read_csv(buffer, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            chunks.append(chunk)
+            yield chunk, min(buffer.tell() / size, 1.0)
+    if chunks:
+        _store(concat_chunks(chunks), cached)
+
+
+def concat_chunks(chunks):
+    '''
+    Concatenate the chunks of a table. Categorical columns stay
+    categorical even when the chunks have different categories.
+    '''
+    if len(chunks) == 1:
+        return chunks[0]
+    categorical = [name for name, dtype in chunks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if categorical:
+        categories = {name: union_categoricals([chunk[name] for chunk in chunks]).categories
+                      for name in categorical}
+        chunks = [chunk.astype({name: pd.CategoricalDtype(categories[name]) for name in categorical})
+                  for chunk in chunks]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def compact_frame(df, max_unique=0.5, float_rtol=1e-6):
+    '''
+    Convert the columns of a DataFrame to compact dtypes:
+
+    - string columns with few distinct values become categoricals,
+    - integer columns (and an integer index) are downcast to the smallest
+      integer type that holds their values,
+    - float64 columns become float32 when all their values are within
+      float32 range and keep a relative precision of float_rtol.
+
+    Parameters
+    -----------
+    df : pd.DataFrame, not modified
+    max_unique : largest ratio of distinct values to rows for a string
+        column to become a categorical
+    float_rtol : largest relative rounding error accepted for float32
+
+    Returns
+    -----------
+    (compacted DataFrame, number of bytes saved)
+    '''
+    before = df.memory_usage(index=True, deep=True).sum()
+    columns = {}
+    for name, column in df.items():
+        kind = column.dtype.kind
+        if kind == 'O':
+            n_unique = column.nunique(dropna=True)
+            if n_unique <= max_unique * len(column) and pd.api.types.infer_dtype(column, skipna=True) == 'string':
+                columns[name] = column.astype('category')
+        elif kind in 'iu':
+            columns[name] = pd.to_numeric(column, downcast='integer' if kind == 'i' else 'unsigned')
+        elif column.dtype == np.float64:
+            values = column.to_numpy()
+            with np.errstate(over='ignore', invalid='ignore'):
+                single = values.astype(np.float32)
+                close = np.allclose(single, values, rtol=float_rtol, atol=0, equal_nan=True)
+            if close and np.array_equal(np.isinf(single), np.isinf(values)):
+                columns[name] = pd.Series(single, index=column.index, name=name)
+    compact = df.assign(**columns)
+    if compact.index.dtype.kind in 'iu' and not isinstance(compact.index, pd.RangeIndex):
+        compact.index = pd.Index(pd.to_numeric(compact.index, downcast='integer'), name=compact.index.name)
+    return compact, int(before - compact.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,70 @@
+"""Level-of-detail helpers for scatter plots with many points.
+
+Browsers slow down badly when an SVG scatter plot has tens of thousands of
+points. Above a size threshold, the plots draw a binned 2D density of the
+points instead, optionally with a random subsample of the points on top.
+"""
+import numpy as np
+
+
+def density_grid(x, y, bins=64):
+    '''
+    Bin points into a regular 2D grid.
+
+    Parameters
+    -----------
+    x, y : 1D arrays of point coordinates; non-finite points are ignored
+    bins : number of bins along each axis
+
+    Returns
+    -----------
+    (x_centers, y_centers, counts) where counts has shape
+    (len(y_centers), len(x_centers)), as expected by bqplot's HeatMap.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[finite], y[finite], bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return x_centers, y_centers, counts.T
+
+
+def subsample(n, size, seed=0):
+    '''
+    Sorted random indices of at most size out of n points. The same
+    seed gives the same subsample, so redraws do not make points jump.
+    '''
+    if size >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=size, replace=False))
+
+
+def reduce_points(x, y, threshold=20000, bins=64, sample=2000):
+    '''
+    Decide how to draw a set of points.
+
+    Parameters
+    -----------
+    x, y : 1D arrays of point coordinates, of the same length
+    threshold : largest number of points drawn as such
+    bins : number of bins along each axis of the density
+    sample : number of points drawn over the density
+
+    Returns
+    -----------
+    dict with the points to draw as 'x' and 'y', and 'density', which is
+    None at or below threshold points, and the density_grid of all the
+    points above it (in which case x and y are a subsample of at most
+    sample points).
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) != len(y):
+        raise ValueError(f"x and y have different lengths ({len(x)} and {len(y)})")
+    if len(x) <= threshold:
+        return {'x': x, 'y': y, 'density': None}
+    density = density_grid(x, y, bins=bins)
+    keep = subsample(len(x), sample)
+    return {'x': x[keep], 'y': y[keep], 'density': density}
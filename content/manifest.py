@@ -0,0 +1,260 @@
+"""Local SQLite index of the objects of the AFQ bucket.
+
+The manifest records every object's key, size and etag, and what its path
+and file name say about it: subject, session, derivative type (such as
+'profiles' or 'sl_count'), tract and file extension. Questions like "which
+subjects have tract profiles" or "how much would downloading them take" are
+then answered by a query on the local index instead of by listing the bucket
+directory by directory.
+
+The index is refreshed incrementally: a refresh lists one prefix of the
+bucket, and only the rows of objects that were added, changed (new etag) or
+removed under that prefix are written.
+"""
+import re
+import sqlite3
+from pathlib import Path, PurePath
+from urllib.parse import urlsplit
+
+from fetch import BASE_URL, Fetcher
+from profiles import TRACTS
+
+
+MANIFEST_PATH = Path('/tmp/cache/afq/manifest.sqlite')
+
+DATATYPES = ('anat', 'dwi', 'func')
+
+_TRACT = re.compile(r'(?:^|[_-])(%s)(?=[_-]|$)'
+                    % '|'.join(re.escape(t) for t in sorted(TRACTS, key=len, reverse=True)))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    subject TEXT,
+    session TEXT,
+    derivative TEXT,
+    tract TEXT,
+    ext TEXT,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_parent ON objects (parent);
+CREATE INDEX IF NOT EXISTS objects_derivative ON objects (derivative, subject);
+CREATE INDEX IF NOT EXISTS objects_subject ON objects (subject);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+'''
+
+_FIELDS = ('subject', 'session', 'derivative', 'tract', 'ext')
+
+
+def parse_key(key):
+    '''
+    What an object key says about the object.
+
+    For example, 'sub-100206/ses-01/sub-100206_dwi_space-RASMM_model-CSD_desc-prob-afq_ARC_L_viz.gif'
+    is the 'viz' derivative of tract ARC_L of subject 100206, session 01, with
+    extension 'gif'. The derivative is the part of the file name after its
+    last key-value entity (desc-prob-afq), without the tract; files with no
+    such part (e.g. the ROI masks) are named after their directory.
+
+    Returns
+    -----------
+    dict with parent (directory of the key), subject, session, derivative,
+    tract and ext; the ones that do not apply are None
+    '''
+    parent, _, name = key.rpartition('/')
+    dirs = parent.split('/') if parent else []
+    stem, _, ext = name.partition('.')
+
+    match = _TRACT.search(stem)
+    tract = match.group(1) if match else None
+
+    tokens = stem.split('_')
+    entities = [i for i, token in enumerate(tokens) if '-' in token]
+    suffix = tokens[entities[-1] + 1:] if entities else tokens
+    if suffix and suffix[0] in DATATYPES:
+        suffix = suffix[1:]
+    if tract is not None:
+        parts = tract.split('_')
+        for i in range(len(suffix) - len(parts) + 1):
+            if suffix[i:i + len(parts)] == parts:
+                suffix = suffix[:i] + suffix[i + len(parts):]
+                break
+
+    return {'parent': parent,
+            'subject': next((d[4:] for d in dirs if d.startswith('sub-')), None),
+            'session': next((d[4:] for d in dirs if d.startswith('ses-')), None),
+            'derivative': '_'.join(suffix) or (dirs[-1] if dirs else stem),
+            'tract': tract,
+            'ext': ext or None}
+
+
+def _range(prefix):
+    "(low, high) bounds of the keys starting with prefix, for a BETWEEN-like query."
+    return prefix, prefix + '\U0010ffff'
+
+
+class Manifest:
+    '''
+    On-disk index of the objects under a base URL (see fetch.Fetcher),
+    queried with keyword filters on subject, session, derivative, tract
+    and ext. A filter value can be a single value or a list of values.
+    '''
+
+    def __init__(self, path=MANIFEST_PATH):
+        '''
+        Parameters
+        -----------
+        path : SQLite file of the manifest, created if it does not exist
+        '''
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def _meta(self, name):
+        row = self._db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def base_url(self):
+        "Base URL the keys are relative to, or None before the first refresh."
+        return self._meta('base_url')
+
+    def refresh(self, base_url=BASE_URL, prefix='', fetcher=None):
+        '''
+        List the objects under prefix and update their rows.
+
+        Parameters
+        -----------
+        base_url : bucket URL or local directory, as for fetch.Fetcher
+        prefix : only refresh the keys starting with this, e.g. 'sub-100206/'
+        fetcher : optional fetch.Fetcher to list with (defaults to a new
+            one for base_url)
+
+        Returns
+        -----------
+        dict with the number of objects added, changed and removed
+        '''
+        fetcher = fetcher or Fetcher(base_url)
+        base_url = fetcher.base_url
+        if self.base_url not in (None, base_url):
+            raise ValueError(f"Manifest '{self.path}' indexes {self.base_url}, not {base_url}")
+
+        known = dict(self._db.execute('SELECT key, etag FROM objects WHERE key >= ? AND key < ?',
+                                      _range(prefix)))
+        added = changed = 0
+        with self._db:
+            for key, size, etag in fetcher.list(prefix):
+                old = known.pop(key, None)
+                if old == etag:
+                    continue
+                if old is None:
+                    added += 1
+                else:
+                    changed += 1
+                fields = parse_key(key)
+                self._db.execute('INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (key, fields['parent'], *(fields[f] for f in _FIELDS), size, etag))
+            self._db.executemany('DELETE FROM objects WHERE key = ?', ((key,) for key in known))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('base_url', ?)", (base_url,))
+        return {'added': added, 'changed': changed, 'removed': len(known)}
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for name, value in filters.items():
+            if name not in _FIELDS:
+                raise TypeError(f"Unknown filter '{name}'")
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = [str(v) for v in value]
+                clauses.append(f"{name} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f'{name} = ?')
+                params.append(str(value))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def keys(self, **filters):
+        "Sorted keys of the objects matching the filters."
+        where, params = self._where(filters)
+        return [row[0] for row in self._db.execute(f'SELECT key FROM objects{where} ORDER BY key', params)]
+
+    def subjects_with(self, derivative, **filters):
+        '''
+        Sorted IDs of the subjects that have the given derivative, e.g.
+        subjects_with('profiles', ext='csv') or subjects_with('viz', tract='ARC_L').
+        '''
+        where, params = self._where(dict(filters, derivative=derivative))
+        where += (' AND' if where else ' WHERE') + ' subject IS NOT NULL'
+        return [row[0] for row in self._db.execute(
+            f'SELECT DISTINCT subject FROM objects{where} ORDER BY subject', params)]
+
+    def total_size(self, **filters):
+        "Total size in bytes of the objects matching the filters."
+        where, params = self._where(filters)
+        return self._db.execute(f'SELECT COALESCE(SUM(size), 0) FROM objects{where}', params).fetchone()[0]
+
+    def __contains__(self, key):
+        return self._db.execute('SELECT 1 FROM objects WHERE key = ?', (key,)).fetchone() is not None
+
+    def listdir(self, prefix=''):
+        '''
+        Names of the subdirectories and of the objects directly under the
+        directory prefix ('' for the top of the bucket).
+
+        Returns
+        -----------
+        (directory names, object names), both sorted
+        '''
+        prefix = prefix.strip('/')
+        files = [row[0].rpartition('/')[2] for row in self._db.execute(
+            'SELECT key FROM objects WHERE parent = ? ORDER BY key', (prefix,))]
+        below = prefix + '/' if prefix else ''
+        dirs = set()
+        for (parent,) in self._db.execute('SELECT DISTINCT parent FROM objects WHERE parent >= ? AND parent < ?',
+                                          _range(below)):
+            if parent != prefix:
+                dirs.add(parent[len(below):].partition('/')[0])
+        return sorted(dirs), files
+
+    def key_of(self, path):
+        '''
+        Key (or directory prefix) of a local path, a cloudpath or a URL under
+        the base URL of the manifest. Raises ValueError for other paths.
+        '''
+        base_url = self.base_url
+        if base_url is None:
+            raise ValueError(f"Manifest '{self.path}' is empty; refresh it first")
+        roots = [base_url.rstrip('/')]
+        parts = urlsplit(base_url)
+        if parts.scheme == 'file':
+            roots.append(parts.path.rstrip('/'))
+        elif parts.scheme in ('http', 'https') and parts.netloc.endswith('.s3.amazonaws.com'):
+            bucket = parts.netloc[:-len('.s3.amazonaws.com')]
+            roots.append(f's3://{bucket}{parts.path}'.rstrip('/'))
+        elif not parts.scheme:
+            roots.append(str(Path(base_url).resolve()))
+
+        name = str(Path(path).resolve()) if isinstance(path, PurePath) else str(path)
+        name = name.rstrip('/')
+        for root in roots:
+            if name == root:
+                return ''
+            if name.startswith(root + '/'):
+                return name[len(root) + 1:]
+        raise ValueError(f"Path '{path}' is not under {base_url}")
@@ -0,0 +1,325 @@
+"""Headless models behind the dashboard plots.
+
+Each model holds one plot's data, indexed for its interactions, and turns
+a selection (the values of the plot's controls) into render-ready arrays
+and labels. Models only use NumPy and pandas: they can be built, queried,
+cached and benchmarked without a widget frontend, and the plots in
+classes.py only copy their output into bqplot marks.
+"""
+import numpy as np
+import pandas as pd
+
+from lod import reduce_points
+from profiles import MEASURES
+from stats import Regression, BitmapIndex, CountCube
+
+
+class TractIndex:
+    '''
+    Per-tract lookup over a long-format tract profiles table.
+
+    The rows are grouped by tract once, so that fetching one tract's
+    profile is a slice into contiguous NumPy blocks (no scan, no copy).
+    The index only depends on the data, so it can be shared by any plot
+    that needs tract profiles.
+    '''
+
+    def __init__(self, tracts, nodes, values, measures):
+        '''
+        Parameters
+        -----------
+        tracts : dict mapping tract name to a slice into nodes and values
+        nodes : 1D array of node ids
+        values : 2D array of shape (rows, measures)
+        measures : list of measure (column) names, in the order of values
+        '''
+        self._slices = tracts
+        self._nodes = nodes
+        self._values = values
+        self._columns = {name: i for i, name in enumerate(measures)}
+
+    @classmethod
+    def from_frame(cls, df, measures=MEASURES):
+        '''
+        Build the index from a profiles DataFrame with tractID and nodeID columns.
+        Tracts keep the order in which they first appear in the file.
+        '''
+        codes, names = pd.factorize(df['tractID'])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+
+        nodes = df['nodeID'].to_numpy()[order]
+        values = np.ascontiguousarray(df[list(measures)].to_numpy()[order])
+
+        tracts = {name: slice(bounds[i], bounds[i + 1]) for i, name in enumerate(names)}
+        return cls(tracts, nodes, values, list(measures))
+
+    @classmethod
+    def from_array(cls, block, tracts, nodes, measures):
+        '''
+        Build the index from a dense tract x node x measure block,
+        such as one subject of a cohort.CohortStore. No data are copied,
+        so a memory-mapped block is only read when a tract is looked up.
+        '''
+        n_nodes = len(nodes)
+        values = block.reshape(len(tracts) * n_nodes, len(measures))
+        slices = {name: slice(i * n_nodes, (i + 1) * n_nodes) for i, name in enumerate(tracts)}
+        return cls(slices, np.tile(nodes, len(tracts)), values, measures)
+
+    @property
+    def tracts(self):
+        return list(self._slices)
+
+    @property
+    def measures(self):
+        return list(self._columns)
+
+    def nodes(self, tract):
+        '''Node ids of the given tract (a view).'''
+        return self._nodes[self._slices[tract]]
+
+    def values(self, tract, measure):
+        '''Profile of one measure along the given tract (a view).'''
+        return self._values[self._slices[tract], self._columns[measure]]
+
+
+class TractModel:
+    '''
+    Profiles of one subject: one measure along one tract, optionally
+    with bands of the cohort's distribution around it.
+    '''
+
+    measures = dict(zip(['Fractional Anisotropy', 'Mean Diffusivity',
+                         'Mean Kurtosis', 'Axonal Water Fraction'], MEASURES))
+
+    band_quantiles = (0.05, 0.95)
+
+    def __init__(self, index, stats=None):
+        '''
+        Parameters
+        -----------
+        index : TractIndex, or a profiles DataFrame to index
+        stats : optional cohort.CohortStats to draw bands from
+        '''
+        if not isinstance(index, TractIndex):
+            index = TractIndex.from_frame(index)
+        self.index = index
+        self.stats = stats
+
+    @property
+    def tracts(self):
+        return self.index.tracts
+
+    @property
+    def labels(self):
+        "Display names of the measures, the options of the measure selector."
+        return list(self.measures)
+
+    def render(self, tract, label):
+        '''
+        Node ids and values of the measure shown as label along tract.
+
+        The cohort bands are the nodes with two rows of values each:
+        band_x, sd_band (mean - SD and mean + SD), quantile_band (the
+        band_quantiles) and the mean. Without statistics for this tract
+        and measure, they are all empty 1D arrays (a widget cannot send
+        an array with two rows of no values).
+        '''
+        view = {'x': self.index.nodes(tract),
+                'y': self.index.values(tract, self.measures[label]),
+                'y_label': label,
+                'band_x': np.array([]), 'mean': np.array([]),
+                'sd_band': np.array([]), 'quantile_band': np.array([])}
+        measure = self.measures[label]
+        if self.stats is not None and tract in self.stats.tracts and measure in self.stats.measures:
+            bands = self.stats.bands(tract, measure, self.band_quantiles)
+            view.update(band_x=bands['nodes'], mean=bands['mean'],
+                        sd_band=np.array([bands['mean'] - bands['std'], bands['mean'] + bands['std']]),
+                        quantile_band=np.array(bands['quantiles']))
+        return view
+
+
+class IndicatorModel:
+    '''
+    Long-format indicator table (Indicator Name, Year, Value, and
+    optionally Country Name): one indicator against another over a range
+    of years, with one point per country and year.
+    '''
+
+    country = 'Country Name'
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._names = frame['Indicator Name'].to_numpy()
+        self._years = frame['Year'].to_numpy()
+        self._values = frame['Value'].to_numpy()
+        self._countries = frame[self.country].to_numpy() if self.country in frame else None
+        self._complete = frame.notna().all(axis=1).to_numpy()
+
+    @property
+    def indicators(self):
+        return self.frame['Indicator Name'].unique()
+
+    @property
+    def years(self):
+        "(first, last) year of the data."
+        return min(self._years), max(self._years)
+
+    def render(self, x_indicator, y_indicator, year_range, **lod):
+        '''
+        Values of the two indicators within year_range (inclusive).
+
+        Parameters
+        -----------
+        x_indicator, y_indicator : indicator names
+        year_range : (first, last) year
+        lod : keyword arguments for lod.reduce_points
+        '''
+        rows = self._complete & (self._years >= year_range[0]) & (self._years <= year_range[1])
+        x, y = self._pair(rows & (self._names == x_indicator), rows & (self._names == y_indicator))
+        return {'points': reduce_points(x, y, **lod),
+                'x_label': x_indicator, 'y_label': y_indicator}
+
+    def _pair(self, x_rows, y_rows):
+        '''
+        Values of the x and y rows that are of the same country and year.
+        Several values of a country and year are paired in the order of
+        the table (without a country column, those of a year are).
+        '''
+        on = ['year', 'n'] if self._countries is None else ['country', 'year', 'n']
+        def keyed(rows):
+            df = pd.DataFrame({'year': self._years[rows], 'value': self._values[rows]})
+            if self._countries is not None:
+                df['country'] = self._countries[rows]
+            df['n'] = df.groupby(on[:-1], sort=False).cumcount()
+            return df
+        pairs = keyed(x_rows).merge(keyed(y_rows), on=on)
+        return pairs['value_x'].to_numpy(), pairs['value_y'].to_numpy()
+
+
+class DemModel:
+    '''
+    Demographics: counts per Age bracket, and the Gender split of
+    all subjects or of one Age bracket.
+    '''
+
+    all_ages = 'All ages'
+
+    def __init__(self, frame=None, dimensions=('Age', 'Gender')):
+        '''
+        Parameters
+        -----------
+        frame : optional DataFrame with the dimensions as columns
+        dimensions : the age and gender column names
+        '''
+        self.age, self.gender = dimensions
+        self.cube = CountCube(dimensions)
+        if frame is not None:
+            self.cube.append(frame)
+
+    def append(self, frame):
+        "Count more rows, without recounting the rows already seen."
+        self.cube.append(frame)
+
+    @property
+    def ages(self):
+        "Options of the age selector."
+        return [self.all_ages] + self.cube.total(self.age)[0]
+
+    def render(self, age):
+        '''
+        Age bracket counts, with a highlight mask of the selected
+        bracket, and the gender split of that bracket.
+        '''
+        ages, age_counts = self.cube.total(self.age)
+        if age == self.all_ages:
+            genders, gender_counts = self.cube.total(self.gender)
+        else:
+            genders, gender_counts = self.cube.total(self.gender, **{self.age: age})
+        return {'ages': ages, 'age_counts': age_counts,
+                'highlight': np.array([value == age for value in ages], dtype=bool),
+                'genders': genders, 'gender_counts': gender_counts}
+
+
+class BehavModel:
+    '''
+    Behavioural measures: one measure against another for the subjects
+    matching some filters (Age bracket, Gender), with regression lines
+    and the correlation matrix of all measures.
+    '''
+
+    def __init__(self, frame, measures, filters=('Age', 'Gender'), values=None):
+        '''
+        Parameters
+        -----------
+        frame : DataFrame of the measures and filter columns; missing
+            values are left out of each plot and line pair by pair
+        measures : names of the measure columns
+        filters : names of the columns subjects can be filtered on;
+            the ones missing from frame are ignored
+        values : optional float32 array of the measures, one row per row
+            of frame (such as the result of features.FeatureTable.join),
+            used instead of the measure columns of frame
+        '''
+        self.measures = pd.Index(measures)
+        if values is None:
+            # column by column: frame[list] would first copy the measures as float64
+            values = np.empty((len(frame), len(self.measures)), dtype=np.float32)
+            for i, name in enumerate(self.measures):
+                values[:, i] = frame[name].to_numpy(dtype=np.float32)
+        self.values = np.ascontiguousarray(values, dtype=np.float32)
+        self.index = BitmapIndex(frame, [name for name in filters if name in frame])
+        self._regressions = {}
+
+    def filter_values(self, name):
+        "Distinct values of a filter column, sorted; empty if it is not in the data."
+        return self.index.values(name) if name in self.index.masks else []
+
+    def regression(self, **filters):
+        '''
+        Correlations and regression lines between all measures for the
+        rows selected by filters, computed in one pass and cached.
+        '''
+        key = tuple(sorted(filters.items()))
+        if key not in self._regressions:
+            rows = self.index.select(**filters)
+            self._regressions[key] = Regression(self.values[rows], self.measures)
+        return self._regressions[key]
+
+    def render(self, x_measure, y_measure, filters, line=False, correlation=False, **lod):
+        '''
+        Parameters
+        -----------
+        x_measure, y_measure : names of the measures to plot
+        filters : dict of column=value filters, see stats.BitmapIndex.select
+        line : whether to compute the regression line
+        correlation : whether to return the correlation matrix
+        lod : keyword arguments for lod.reduce_points
+
+        Returns
+        -----------
+        dict with the points, the regression line (empty arrays if not
+        requested or not defined) and the correlation matrix (None if
+        not requested) as names and values
+        '''
+        rows = self.index.select(**filters)
+        x = self.values[rows, self.measures.get_loc(x_measure)]
+        y = self.values[rows, self.measures.get_loc(y_measure)]
+        complete = ~(np.isnan(x) | np.isnan(y))
+        if not complete.all():
+            x, y = x[complete], y[complete]
+
+        if line and len(x) > 1:
+            line_x = np.array([np.min(x), np.max(x)])
+            line_y = self.regression(**filters).line(x_measure, y_measure, line_x)
+        else:
+            line_x = line_y = np.array([])
+
+        corr = None
+        if correlation:
+            regression = self.regression(**filters)
+            corr = {'names': regression.names, 'values': regression.corr}
+
+        return {'points': reduce_points(x, y, **lod),
+                'line_x': line_x, 'line_y': line_y, 'corr': corr,
+                'x_label': x_measure, 'y_label': y_measure}
@@ -0,0 +1,40 @@
+"""Names along the axes of AFQ tract profiles.
+
+The *_desc-prob-afq_profiles.csv files have one row per tract (tractID) and
+node (nodeID), with one column per DKI measure. TRACTS and MEASURES are the
+tracts and measures of the HCP derivatives; the other modules import them from
+here. fill_block writes the rows of a profiles table into a dense
+tract x node x measure array, as CohortStore, CohortStats and FeatureTable
+keep them.
+"""
+import numpy as np
+import pandas as pd
+
+
+TRACTS = ['ATR_R', 'ATR_L', 'CGC_R', 'CGC_L', 'CST_R', 'CST_L', 'IFO_R', 'IFO_L',
+          'ILF_R', 'ILF_L', 'SLF_R', 'SLF_L', 'ARC_R', 'ARC_L', 'UNC_R', 'UNC_L',
+          'AntFrontal', 'Motor', 'Occipital', 'Orbital', 'PostParietal',
+          'SupFrontal', 'SupParietal', 'Temporal']
+
+MEASURES = ['dki_fa', 'dki_md', 'dki_mk', 'dki_awf']
+
+
+def fill_block(block, df, tracts, nodes, measures):
+    '''
+    Write the rows of a profiles DataFrame into a tract x node x measure
+    block. Rows of other tracts or nodes are skipped.
+
+    Parameters
+    -----------
+    block : array of shape (len(tracts), len(nodes), len(measures))
+    df : profiles DataFrame with tractID, nodeID and the measure columns
+    tracts : list of tract names, in the order of the first axis
+    nodes : sorted 1D array of node ids, in the order of the second axis
+    measures : list of measure columns, in the order of the last axis
+    '''
+    t = pd.Index(tracts).get_indexer(df['tractID'])
+    n = np.searchsorted(nodes, df['nodeID'].to_numpy())
+    n_valid = n < len(nodes)
+    n_valid[n_valid] = nodes[n[n_valid]] == df['nodeID'].to_numpy()[n_valid]
+    keep = (t >= 0) & n_valid
+    block[t[keep], n[keep]] = df[list(measures)].to_numpy(dtype=np.float32)[keep]
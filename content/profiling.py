@@ -0,0 +1,190 @@
+"""Opt-in timing of the dashboard's hot paths.
+
+The file loader, the observer notification and every plot redraw report to
+the module-level profiler. While it is disabled (the default), tracking a
+block costs one attribute check. Once enabled with profiler.enable(), it
+keeps per-operation call counts, row and byte totals, and the durations of
+the last calls, from which rolling percentiles are computed.
+
+Startup milestones (such as the first paint of the dashboard) are always
+recorded, as seconds since this module was imported. Import it first to
+measure the whole startup.
+"""
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _Track:
+    '''Timing of one tracked block. Counters can be added while it runs.'''
+
+    __slots__ = ('name', 'counts')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+
+class _NullTrack:
+    '''Stand-in returned while the profiler is disabled.'''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_TRACK = _NullTrack()
+
+
+class Profiler:
+    '''
+    Collects timings and counters of named operations.
+
+    Operation names are '<Class>.<operation>', for example
+    'BehavPlot._update_app' or 'FileLoader.parse'.
+    '''
+
+    def __init__(self, window=500):
+        '''
+        Parameters
+        -----------
+        window : number of most recent calls used for the percentiles
+        '''
+        self.enabled = False
+        self.window = window
+        self._durations = {}
+        self._stats = {}
+        self.started = time.perf_counter()
+        self.milestones = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._durations.clear()
+        self._stats.clear()
+
+    def track(self, owner, operation):
+        '''
+        Context manager timing one call of an operation. The yielded object
+        has an add(**counts) method for counters such as rows or bytes.
+
+        Parameters
+        -----------
+        owner : the object doing the work, or a class name
+        operation : name of the operation, e.g. '_update_app'
+        '''
+        if not self.enabled:
+            return _NULL_TRACK
+        name = owner if isinstance(owner, str) else type(owner).__name__
+        return self._track(f'{name}.{operation}')
+
+    @contextmanager
+    def _track(self, name):
+        track = _Track(name)
+        start = time.perf_counter()
+        try:
+            yield track
+        finally:
+            self.record(name, time.perf_counter() - start, **track.counts)
+
+    def mark(self, name):
+        '''
+        Record that a startup milestone was reached, in seconds since the
+        profiler was created. Only the first time counts. Milestones are
+        recorded even while the profiler is disabled.
+        '''
+        if name not in self.milestones:
+            self.milestones[name] = time.perf_counter() - self.started
+
+    def record(self, name, seconds, **counts):
+        '''Add one call of an operation that took the given number of seconds.'''
+        if name not in self._durations:
+            self._durations[name] = deque(maxlen=self.window)
+            self._stats[name] = {'calls': 0, 'total_s': 0.0}
+        self._durations[name].append(seconds)
+        stats = self._stats[name]
+        stats['calls'] += 1
+        stats['total_s'] += seconds
+        for key, value in counts.items():
+            stats[key] = stats.get(key, 0) + value
+
+    def summary(self):
+        '''
+        Statistics of every operation, as a dict mapping operation names to
+        calls, total time, rolling percentiles (in ms) and counter totals.
+        '''
+        import numpy as np
+
+        summary = {}
+        for name, durations in sorted(self._durations.items()):
+            ms = np.array(durations) * 1000
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            summary[name] = dict(self._stats[name], p50_ms=p50, p90_ms=p90, p99_ms=p99, max_ms=ms.max())
+        return summary
+
+    def to_json(self, path=None):
+        '''
+        Export the summary, and the milestones under 'milestones', as JSON.
+        Writes it to path if given, and returns the JSON string.
+        '''
+        text = json.dumps(dict(self.summary(), milestones=self.milestones), indent=2, default=float)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def panel(self):
+        '''
+        An ipywidgets panel showing the summary as a table,
+        with buttons to refresh it and to reset the statistics.
+        '''
+        import ipywidgets as widgets
+
+        table = widgets.HTML()
+        refresh = widgets.Button(description='Refresh')
+        reset = widgets.Button(description='Reset')
+        enabled = widgets.Checkbox(value=self.enabled, description='Profiling enabled', indent=False)
+
+        def show(_=None):
+            rows = ''.join(
+                f'<tr><td>{name}</td><td>{s["calls"]}</td><td>{s["p50_ms"]:.2f}</td>'
+                f'<td>{s["p90_ms"]:.2f}</td><td>{s["p99_ms"]:.2f}</td><td>{s["total_s"]:.3f}</td>'
+                f'<td>{s.get("rows", "")}</td><td>{s.get("bytes", "")}</td></tr>'
+                for name, s in self.summary().items())
+            startup = ', '.join(f'{name}: {seconds:.2f} s' for name, seconds in self.milestones.items())
+            table.value = (f'<p>Startup: {startup or "no milestones"}</p>'
+                           '<table><tr><th>operation</th><th>calls</th><th>p50 ms</th><th>p90 ms</th>'
+                           '<th>p99 ms</th><th>total s</th><th>rows</th><th>bytes</th></tr>'
+                           f'{rows}</table>')
+
+        def clear(_):
+            self.reset()
+            show()
+
+        def toggle(change):
+            self.enabled = change['new']
+
+        refresh.on_click(show)
+        reset.on_click(clear)
+        enabled.observe(toggle, names='value')
+        show()
+        return widgets.VBox([widgets.HBox([enabled, refresh, reset]), table])
+
+
+profiler = Profiler()
@@ -0,0 +1,196 @@
+"""Slices of NIfTI volumes, served from memory-mapped multi-resolution copies.
+
+A volume is converted once into a directory of uncompressed float32 arrays:
+level 0 at full resolution, and each further level the 2x2x2 block means of
+the one before, down to a few tens of voxels on a side. Conversion reads the
+compressed file slab by slab, so the whole volume is never in memory. The
+levels are opened as memory maps, and a slice is read from the coarsest level
+that still has at least the requested number of pixels, so a 256 pixel wide
+view of a 1 mm T1 never touches the full resolution data.
+
+nibabel is only needed to convert a file; it is imported then.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+CACHE_DIR = Path('/tmp/cache/slices')
+INDEX_FILE = 'index.json'
+
+AXES = {'sagittal': 0, 'coronal': 1, 'axial': 2}
+
+SLAB = 16 #planes read at a time during conversion (even, for the 2x2x2 means)
+
+
+def _level_file(level):
+    return f'level{level}.npy'
+
+
+def _halve(block):
+    "2x2x2 block means of a 3D array; odd sizes are padded by repeating the last plane."
+    pad = [(0, n % 2) for n in block.shape]
+    if any(after for _, after in pad):
+        block = np.pad(block, pad, mode='edge')
+    x, y, z = (n // 2 for n in block.shape)
+    return block.reshape(x, 2, y, 2, z, 2).mean(axis=(1, 3, 5), dtype=np.float32)
+
+
+class SliceStore:
+    '''
+    A volume and its downsampled copies, sliced along any of its axes.
+
+    Use SliceStore.from_nifti to convert (or reopen the conversion of) a
+    NIfTI file, SliceStore.from_array for an array in memory, and
+    SliceStore.open for a directory written before.
+    '''
+
+    def __init__(self, levels, zooms, value_range):
+        '''
+        Parameters
+        -----------
+        levels : list of 3D arrays, each half the size of the one before
+        zooms : voxel sizes of level 0 along the three axes
+        value_range : (low, high) display range of the values
+        '''
+        self.levels = levels
+        self.zooms = tuple(float(z) for z in zooms)
+        self.value_range = tuple(float(v) for v in value_range)
+
+    @property
+    def shape(self):
+        "Shape of the full resolution volume."
+        return self.levels[0].shape
+
+    @classmethod
+    def open(cls, directory):
+        '''Open a converted volume as memory maps.'''
+        directory = Path(directory)
+        with open(directory / INDEX_FILE) as f:
+            index = json.load(f)
+        levels = [np.load(directory / _level_file(k), mmap_mode='r') for k in range(index['levels'])]
+        return cls(levels, index['zooms'], index['value_range'])
+
+    @classmethod
+    def _write(cls, directory, shape, read_slab, zooms, min_size):
+        '''
+        Write level 0 from read_slab(start, stop), which returns the planes
+        start to stop along the last axis, then the coarser levels from it,
+        one slab of planes at a time.
+        '''
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        level = np.lib.format.open_memmap(directory / _level_file(0), mode='w+',
+                                          dtype=np.float32, shape=tuple(shape))
+        for start in range(0, shape[2], SLAB):
+            level[:, :, start:start + SLAB] = read_slab(start, min(start + SLAB, shape[2]))
+        level.flush()
+        levels = [level]
+
+        while max(level.shape) > min_size:
+            shape = tuple((n + 1) // 2 for n in level.shape)
+            coarser = np.lib.format.open_memmap(directory / _level_file(len(levels)), mode='w+',
+                                                dtype=np.float32, shape=shape)
+            for start in range(0, level.shape[2], SLAB):
+                coarser[:, :, start // 2:(start + SLAB) // 2] = _halve(np.asarray(level[:, :, start:start + SLAB]))
+            coarser.flush()
+            levels.append(coarser)
+            level = coarser
+
+        # display range from a coarse level, robust to a few extreme voxels
+        values = np.asarray(level)
+        values = values[np.isfinite(values)]
+        low, high = np.percentile(values, [1, 99.5]) if values.size else (0.0, 1.0)
+        with open(directory / INDEX_FILE, 'w') as f: #written last: marks a complete conversion
+            json.dump({'shape': list(levels[0].shape), 'levels': len(levels),
+                       'zooms': [float(z) for z in zooms], 'value_range': [float(low), float(high)]}, f)
+        return cls.open(directory)
+
+    @classmethod
+    def from_array(cls, data, directory, zooms=(1.0, 1.0, 1.0), min_size=32):
+        '''
+        Convert a 3D array.
+
+        Parameters
+        -----------
+        data : 3D array (or memory map) of the volume
+        directory : directory to write the levels to
+        zooms : voxel sizes along the three axes
+        min_size : the coarsest level has no side longer than this
+        '''
+        return cls._write(directory, data.shape, lambda start, stop: data[:, :, start:stop], zooms, min_size)
+
+    @classmethod
+    def from_nifti(cls, path, volume=0, cache_dir=CACHE_DIR, min_size=32):
+        '''
+        Slices of a NIfTI file (.nii or .nii.gz), converted on first use and
+        then reopened from the cache until the file changes.
+
+        Parameters
+        -----------
+        path : path of the NIfTI file
+        volume : volume to show, for 4D files
+        cache_dir : directory holding the converted volumes
+        min_size : the coarsest level has no side longer than this
+        '''
+        stat = os.stat(path)
+        key = f'{Path(path).resolve()}:{stat.st_size}-{stat.st_mtime_ns}:{volume}'
+        directory = Path(cache_dir) / hashlib.sha256(key.encode()).hexdigest()[:16]
+        if (directory / INDEX_FILE).exists():
+            return cls.open(directory)
+
+        import nibabel as nib
+
+        image = nib.load(str(path))
+        proxy = image.dataobj
+
+        def read_slab(start, stop):
+            if len(image.shape) == 4:
+                return proxy[:, :, start:stop, volume]
+            return proxy[:, :, start:stop]
+
+        return cls._write(directory, image.shape[:3], read_slab, image.header.get_zooms()[:3], min_size)
+
+    def level_for(self, axis, max_size=None):
+        '''
+        The coarsest level whose slices along axis still have at least
+        max_size pixels along their longest side (0 if max_size is None).
+        '''
+        axis = AXES.get(axis, axis)
+        if max_size is None:
+            return 0
+        level = 0
+        for k, data in enumerate(self.levels):
+            if max(n for i, n in enumerate(data.shape) if i != axis) < max_size:
+                break
+            level = k
+        return level
+
+    def slice(self, axis, index, max_size=None):
+        '''
+        One slice of the volume.
+
+        Parameters
+        -----------
+        axis : 'sagittal', 'coronal', 'axial', or 0, 1, 2
+        index : position of the slice along axis, in full resolution voxels
+        max_size : display size in pixels; the slice is read from the
+            coarsest level with at least that many pixels on its longest
+            side. None reads the full resolution.
+
+        Returns
+        -----------
+        dict with the slice as a 2D float32 array (the remaining axes in
+        order) and the level and voxel sizes (spacing) it was read from
+        '''
+        axis = AXES.get(axis, axis)
+        level = self.level_for(axis, max_size)
+        data = self.levels[level]
+        i = min(max(int(index), 0) >> level, data.shape[axis] - 1)
+        spacing = [z * 2 ** level for n, z in enumerate(self.zooms) if n != axis]
+        return {'image': np.array(np.take(data, i, axis=axis), dtype=np.float32),
+                'level': level, 'spacing': spacing}
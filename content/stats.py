@@ -0,0 +1,162 @@
+"""Vectorized statistics shared by the dashboard plots."""
+import numpy as np
+import pandas as pd
+
+
+class Regression:
+    '''
+    Pairwise correlations and least-squares lines between all columns
+    of a data matrix, computed in one pass.
+
+    For columns i and j, the line predicting column j from column i is
+    intercept[i, j] + slope[i, j] * x, and corr[i, j] is their Pearson
+    correlation. Missing values (NaN) are left out pair by pair: each
+    pair of columns uses the n[i, j] rows where both are present.
+    '''
+
+    def __init__(self, values, names=None):
+        '''
+        Parameters
+        -----------
+        values : 2D array of shape (rows, columns), NaN for missing values
+        names : optional list of column names
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        self.names = list(names) if names is not None else list(range(values.shape[1]))
+
+        present = ~np.isnan(values)
+        weights = present.astype(np.float64)
+        self.n = weights.T @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = values.sum(axis=0, where=present) / present.sum(axis=0)
+
+        # sums over the rows complete in each pair, of values centered on the
+        # column means (for precision; the statistics do not depend on it)
+        centered = np.where(present, values - np.nan_to_num(self.mean), 0.0)
+        sums = centered.T @ weights #sums[i, j]: sum of column i over the rows where j is present
+        squares = (centered * centered).T @ weights
+        products = centered.T @ centered
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = sums / self.n
+            mean_y = sums.T / self.n
+            cov = (products - self.n * mean_x * mean_y) / np.maximum(self.n - 1, 1)
+            var_x = (squares - self.n * mean_x ** 2) / np.maximum(self.n - 1, 1)
+            var_y = var_x.T
+            self.slope = cov / var_x
+            self.corr = cov / np.sqrt(var_x * var_y)
+        shift = np.nan_to_num(self.mean)
+        self.intercept = (mean_y + shift[None, :]) - self.slope * (mean_x + shift[:, None])
+
+    def line(self, x_name, y_name, x):
+        '''Values of the regression line predicting y_name from x_name at x.'''
+        i = self.names.index(x_name)
+        j = self.names.index(y_name)
+        return self.intercept[i, j] + self.slope[i, j] * np.asarray(x)
+
+
+class BitmapIndex:
+    '''
+    One boolean mask per distinct value of some categorical columns,
+    so that filtering on any combination of values is a few mask ANDs.
+    '''
+
+    def __init__(self, frame, columns):
+        '''
+        Parameters
+        -----------
+        frame : pd.DataFrame to index
+        columns : names of the (low-cardinality) columns to index
+        '''
+        self.n = len(frame)
+        self.masks = {}
+        for name in columns:
+            codes, values = pd.factorize(frame[name], sort=True)
+            self.masks[name] = {value: codes == i for i, value in enumerate(values)}
+        self._selections = {}
+
+    def values(self, column):
+        '''Distinct values of an indexed column, sorted.'''
+        return list(self.masks[column])
+
+    def select(self, **filters):
+        '''
+        Indices of the rows matching all the given column=value filters.
+        Filters whose value is not a value of that column (such as 'All')
+        are ignored. Results are cached per combination of filters.
+        '''
+        filters = tuple(sorted((name, value) for name, value in filters.items()
+                               if name in self.masks and value in self.masks[name]))
+        if filters not in self._selections:
+            mask = np.ones(self.n, dtype=bool)
+            for name, value in filters:
+                mask &= self.masks[name][value]
+            self._selections[filters] = np.flatnonzero(mask)
+        return self._selections[filters]
+
+
+class CountCube:
+    '''
+    Number of rows for every combination of values of some columns
+    (for instance Age x Gender), so that counts along one column, for any
+    fixed values of the others, are slices of the cube instead of rescans.
+    Rows with a missing value in any of the columns are not counted.
+    '''
+
+    def __init__(self, dimensions):
+        '''
+        Parameters
+        -----------
+        dimensions : names of the columns to count over
+        '''
+        self.dimensions = list(dimensions)
+        self.labels = {name: [] for name in self.dimensions}
+        self.counts = np.zeros((0,) * len(self.dimensions), dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, frame, dimensions):
+        cube = cls(dimensions)
+        cube.append(frame)
+        return cube
+
+    def append(self, frame):
+        '''
+        Add the counts of new rows. Values not seen before extend the cube.
+        '''
+        frame = frame[self.dimensions].dropna()
+        codes = []
+        for axis, name in enumerate(self.dimensions):
+            labels = self.labels[name]
+            new = [value for value in pd.unique(frame[name]) if value not in labels]
+            if new:
+                labels.extend(new)
+                pad = [(0, 0)] * self.counts.ndim
+                pad[axis] = (0, len(new))
+                self.counts = np.pad(self.counts, pad)
+            codes.append(pd.Index(labels).get_indexer(frame[name]))
+        np.add.at(self.counts, tuple(codes), 1)
+
+    def total(self, dimension, **fixed):
+        '''
+        Counts along one dimension, summed over the others, with the
+        dimensions given as keyword arguments fixed to a value.
+
+        Returns
+        -----------
+        (labels, counts), sorted by label
+        '''
+        counts = self.counts
+        for axis in reversed(range(len(self.dimensions))):
+            name = self.dimensions[axis]
+            if name == dimension:
+                continue
+            if name in fixed:
+                labels = self.labels[name]
+                if fixed[name] in labels:
+                    counts = counts.take(labels.index(fixed[name]), axis=axis)
+                else:
+                    counts = np.zeros(np.delete(counts.shape, axis), dtype=counts.dtype)
+            else:
+                counts = counts.sum(axis=axis)
+        labels = self.labels[dimension]
+        order = np.argsort(np.array(labels, dtype=object)) if labels else np.arange(0)
+        return [labels[i] for i in order], counts[order]
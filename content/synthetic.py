@@ -0,0 +1,127 @@
+"""Synthetic data in the schemas of the HCP files used by the dashboard.
+
+The generators produce AFQ tract profiles (tractID, nodeID, dki_* columns),
+streamline counts and HCP behavioural tables (Subject, Age, Gender, *_AgeAdj,
+FS_* and filler columns) of any size, for benchmarks and for trying the
+dashboard without access to the real data.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiles import MEASURES, TRACTS
+
+
+N_NODES = 100
+
+# typical value and spread of each DKI measure, in the order of MEASURES
+SPREADS = [(0.45, 0.1), (0.0008, 0.0001), (0.9, 0.15), (0.35, 0.06)]
+
+COGNITIVE = ['PicSeq_AgeAdj', 'CardSort_AgeAdj', 'Flanker_AgeAdj', 'ListSort_AgeAdj',
+             'ReadEng_AgeAdj', 'PicVocab_AgeAdj', 'ProcSpeed_AgeAdj']
+FREESURFER = ['FS_TotCort_GM_Vol', 'FS_SubCort_GM_Vol', 'FS_Total_GM_Vol',
+              'FS_L_WM_Vol', 'FS_R_WM_Vol', 'FS_Tot_WM_Vol']
+AGES = ['22-25', '26-30', '31-35', '36+']
+GENDERS = ['F', 'M']
+
+# size of the HCP Young Adult behavioural table
+HCP_SUBJECTS = 1206
+HCP_COLUMNS = 582
+
+PROFILES_NAME = 'sub-{sub}_dwi_space-RASMM_model-CSD_desc-prob-afq_profiles.csv'
+SL_COUNT_NAME = 'sub-{sub}_dwi_space-RASMM_model-CSD_desc-prob-afq_sl_count.csv'
+
+
+def subject_ids(n_subjects, start=100000):
+    "Returns n_subjects distinct subject IDs as strings."
+    return [str(start + i) for i in range(n_subjects)]
+
+
+def profiles_frame(seed=0, tracts=TRACTS, n_nodes=N_NODES):
+    "Returns one subject's tract profiles, in the layout of *_profiles.csv."
+    rng = np.random.default_rng(seed)
+    nodes = np.arange(n_nodes)
+    # smooth profiles: a bump along each tract plus noise
+    shape = np.sin(np.pi * nodes / (n_nodes - 1))
+    df = pd.DataFrame({'tractID': np.repeat(tracts, n_nodes),
+                       'nodeID': np.tile(nodes, len(tracts))})
+    for name, (center, spread) in zip(MEASURES, SPREADS):
+        offset = rng.normal(0, spread, size=(len(tracts), 1))
+        noise = rng.normal(0, spread / 5, size=(len(tracts), n_nodes))
+        df[name] = (center + offset + spread * shape + noise).ravel()
+    return df
+
+
+def sl_count_frame(seed=0, tracts=TRACTS):
+    "Returns one subject's streamline counts, in the layout of *_sl_count.csv."
+    rng = np.random.default_rng(seed)
+    n_streamlines = rng.integers(500, 5000, size=len(tracts))
+    clean = (n_streamlines * rng.uniform(0.9, 1.0, size=len(tracts))).astype(int)
+    return pd.DataFrame({'n_streamlines': n_streamlines, 'n_streamlines_clean': clean},
+                        index=tracts)
+
+
+def write_profiles(directory, n_subjects, seed=0):
+    '''
+    Write profiles and streamline count files for n_subjects subjects, laid
+    out like the AFQ bucket: <directory>/sub-<id>/ses-01/<files>.
+
+    Returns
+    -----------
+    list of the subject IDs written
+    '''
+    directory = Path(directory)
+    subjects = subject_ids(n_subjects)
+    for i, sub in enumerate(subjects):
+        session = directory / f'sub-{sub}' / 'ses-01'
+        session.mkdir(parents=True, exist_ok=True)
+        profiles_frame(seed + i).to_csv(session / PROFILES_NAME.format(sub=sub))
+        sl_count_frame(seed + i).to_csv(session / SL_COUNT_NAME.format(sub=sub))
+    return subjects
+
+
+def behavioural_frame(n_rows=HCP_SUBJECTS, n_columns=HCP_COLUMNS, seed=0, missing=0.02):
+    '''
+    Returns an HCP-like behavioural table.
+
+    Parameters
+    -----------
+    n_rows : number of subjects
+    n_columns : total number of columns; columns beyond the ones the
+        dashboard uses are numeric filler
+    seed : random seed
+    missing : fraction of missing values in the score columns
+    '''
+    rng = np.random.default_rng(seed)
+    columns = {'Subject': np.arange(100000, 100000 + n_rows),
+               'Release': np.full(n_rows, 'S1200'),
+               'Gender': rng.choice(GENDERS, n_rows),
+               'Age': rng.choice(AGES, n_rows)}
+    for name in COGNITIVE:
+        columns[name] = rng.normal(100, 15, n_rows)
+    for name in FREESURFER:
+        columns[name] = rng.normal(500000, 80000, n_rows)
+    for i in range(max(n_columns - len(columns), 0)):
+        columns[f'Extra_{i}'] = rng.normal(size=n_rows)
+    df = pd.DataFrame(columns)
+
+    scores = COGNITIVE + FREESURFER
+    holes = rng.random((n_rows, len(scores))) < missing
+    df[scores] = df[scores].mask(holes)
+    return df
+
+
+def write_behavioural(path, n_rows=HCP_SUBJECTS, n_columns=HCP_COLUMNS, seed=0):
+    "Writes behavioural_frame(n_rows, n_columns, seed) as CSV to path."
+    behavioural_frame(n_rows, n_columns, seed).to_csv(path, index=False)
+    return Path(path)
+
+
+def indicators_frame(n_rows=1000, n_indicators=5, n_countries=200, seed=0):
+    "Returns a table in the long Country Name / Indicator Name / Year / Value layout used by App."
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Country Name': rng.choice([f'Country {i}' for i in range(n_countries)], n_rows),
+                         'Indicator Name': rng.choice([f'Indicator {i}' for i in range(n_indicators)], n_rows),
+                         'Year': rng.integers(1960, 2020, n_rows),
+                         'Value': rng.normal(size=n_rows)})
@@ -0,0 +1,251 @@
+"""Thumbnails of the per-tract bundle renderings (viz_bundles/*_viz.gif).
+
+Every session directory has one animated GIF per tract, of about 600 kB each.
+They are only read when a tract is shown, downscaled once and kept as
+thumbnails in a disk cache, so later sessions read the small copies. The
+thumbnails of the tracts next to the shown one are loaded in the background,
+so that switching tracts does not wait for them: in threads, or where threads
+cannot be started (in the browser), one at a time in an asyncio task of the
+kernel's event loop, in between the handling of other messages.
+
+Downscaling needs Pillow. Without it, the thumbnails are the original images:
+they still get the background loading, but are not copied to the cache.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from manifest import parse_key
+
+
+CACHE_DIR = Path('/tmp/cache/thumbnails')
+SIZE = 240 #pixels, longest side
+
+
+def _pillow():
+    "Returns the PIL.Image module, or None if Pillow is not installed."
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def bundle_images(directory):
+    '''
+    Bundle renderings in a session directory, or in its viz_bundles
+    subdirectory.
+
+    Returns
+    -----------
+    dict mapping tract names to the paths of their images
+    '''
+    directory = Path(directory)
+    if (directory / 'viz_bundles').is_dir():
+        directory = directory / 'viz_bundles'
+    images = {}
+    for path in sorted(directory.glob('*_viz.gif')):
+        fields = parse_key(path.name)
+        if fields['tract'] is not None:
+            images[fields['tract']] = path
+    return images
+
+
+def make_thumbnail(data, size=SIZE):
+    '''
+    Downscale an image (all the frames of an animated GIF) so that its
+    longest side is at most size pixels.
+
+    Parameters
+    -----------
+    data : image file content as bytes
+    size : largest width or height of the thumbnail, in pixels
+
+    Returns
+    -----------
+    the thumbnail as GIF bytes, or data itself if Pillow is not installed
+    or the image is small enough already
+    '''
+    Image = _pillow()
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= size:
+            return data
+        frames, durations = [], []
+        for i in range(getattr(image, 'n_frames', 1)):
+            image.seek(i)
+            frame = image.convert('RGB')
+            frame.thumbnail((size, size))
+            frames.append(frame)
+            durations.append(image.info.get('duration', 100))
+        out = io.BytesIO()
+        frames[0].save(out, format='GIF', save_all=len(frames) > 1, append_images=frames[1:],
+                       duration=durations, loop=image.info.get('loop', 0), optimize=True)
+    return out.getvalue()
+
+
+class Thumbnails:
+    '''
+    Thumbnails of a set of images, loaded on demand.
+
+    get(name) returns the thumbnail of one image, loading it if needed, and
+    prefetch(names) loads others in the background. Thumbnails are
+    cached on disk (keyed by the image path, size, modification time and
+    thumbnail size) and the most recently used ones are kept in memory.
+    '''
+
+    def __init__(self, images, size=SIZE, cache_dir=CACHE_DIR, max_workers=2, memory_items=12):
+        '''
+        Parameters
+        -----------
+        images : dict mapping names (e.g. tracts) to image paths
+        size : largest width or height of the thumbnails, in pixels
+        cache_dir : directory of the thumbnail cache
+        max_workers : number of background loading threads
+        memory_items : number of thumbnails kept in memory
+        '''
+        self.images = dict(images)
+        self.size = size
+        self.cache_dir = Path(cache_dir)
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._max_workers = max_workers
+        self._pool = None
+        self._threads = sys.platform != 'emscripten'
+        self._queue = deque() #names left to prefetch without threads
+        self._task = None
+
+    def __contains__(self, name):
+        return name in self.images
+
+    def _cache_path(self, path):
+        stat = os.stat(path)
+        key = f'{Path(path).resolve()}:{stat.st_size}-{stat.st_mtime_ns}:{self.size}'
+        return self.cache_dir / f'{hashlib.sha256(key.encode()).hexdigest()}.gif'
+
+    def _load(self, name):
+        '''Thumbnail of one image, from the disk cache or made and cached.'''
+        path = self.images[name]
+        cached = self._cache_path(path)
+        if cached.exists():
+            return cached.read_bytes()
+        original = Path(path).read_bytes()
+        data = make_thumbnail(original, self.size)
+        if data is original:
+            return data #nothing smaller to cache
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp.write_bytes(data)
+            tmp.replace(cached)
+        except OSError:
+            pass #a read-only cache only costs the caching
+        return data
+
+    def _remember(self, name, data):
+        with self._lock:
+            self._memory[name] = data
+            self._memory.move_to_end(name)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, name):
+        '''
+        Thumbnail of one image as GIF bytes, or None if there is no image
+        of that name or it cannot be read (missing or corrupt file). Waits
+        for it if it is being prefetched.
+        '''
+        if name not in self.images:
+            return None
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                return data
+            future = self._pending.get(name)
+        try:
+            if future is not None and not future.cancelled():
+                data = future.result()
+            else:
+                data = self._load(name)
+        except Exception:
+            return None #not remembered, so the next get tries again
+        self._remember(name, data)
+        return data
+
+    def prefetch(self, names):
+        '''
+        Load the thumbnails of the given images in the background. Where
+        threads cannot be started (e.g. in the browser), they are loaded
+        by a task of the running event loop, replacing the ones left from
+        the previous call, or not at all if no loop is running.
+        '''
+        names = list(names)
+        if not self._threads:
+            self._prefetch_async(names)
+            return
+        for i, name in enumerate(names):
+            with self._lock:
+                if name not in self.images or name in self._memory or name in self._pending:
+                    continue
+            try:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix='thumbnails')
+                future = self._pool.submit(self._load, name)
+            except RuntimeError:
+                self._threads = False
+                self._prefetch_async(names[i:])
+                return
+            with self._lock:
+                self._pending[name] = future
+            future.add_done_callback(lambda f, name=name: self._done(name, f))
+
+    def _prefetch_async(self, names):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._queue.clear()
+        self._queue.extend(name for name in names if name in self.images)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run_queue())
+
+    async def _run_queue(self):
+        while self._queue:
+            await asyncio.sleep(0) #let the kernel handle other messages first
+            if not self._queue:
+                break
+            name = self._queue.popleft()
+            if name in self._memory:
+                continue
+            try:
+                data = self._load(name)
+            except Exception:
+                continue #get() loads it again, and reports the error
+            self._remember(name, data)
+
+    def _done(self, name, future):
+        with self._lock:
+            self._pending.pop(name, None)
+        if not future.cancelled() and future.exception() is None:
+            self._remember(name, future.result())
+
+    def close(self):
+        '''Stop the background loading.'''
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,24 +1,105 @@
 """Utilities for use with the 2023 NeuroHackademy data showcase.
 """
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from functools import partial
 
 
-def ls(path):
-    "Lists the contents of the given path."
+def ls(path, pattern=None, manifest=None):
+    "Lists the contents of the given path (see walk for pattern and manifest)."
+    children = _scan(path) if manifest is None else _manifest_scan(manifest, path)
     # If path is not a directory, raise an error:
-    if not path.is_dir():
+    if children is None:
         raise ValueError(f"Path '{path}' is not a directory")
     else:
-        return list(path.iterdir())
+        return [p for p in children if pattern is None or fnmatch(p.name, pattern)]
+
+
+def _scan(path):
+    "Returns the children of path sorted by name, or None if path is not a directory."
+    if not path.is_dir():
+        return None
+    return sorted(path.iterdir(), key=lambda p: p.name)
+
+
+def _manifest_scan(manifest, path):
+    "Same as _scan, from the listing recorded in a manifest.Manifest."
+    dirs, files = manifest.listdir(manifest.key_of(path))
+    if not dirs and not files:
+        return None
+    return sorted((path / name for name in dirs + files), key=lambda p: p.name)
+
+
+class _Deferred:
+    "Stand-in for a future, for when no thread can be started."
 
+    def __init__(self, function, *args):
+        self._call = (function, args)
 
-def crawl(path, indent=0):
-    "Prints a nested tree of the contents of the given path."
-    print((' '*indent) + path.name)
-    if path.is_dir():
-        for subpath in path.iterdir():
-            crawl(subpath, indent=(indent + 3))
+    def result(self):
+        function, args = self._call
+        return function(*args)
+
+
+def walk(path, max_depth=None, pattern=None, max_workers=8, manifest=None):
+    '''
+    Yields (depth, path) for the given path and everything below it,
+    depth-first and in name order, the given path having depth 0.
+
+    Directories are listed ahead of time by a pool of max_workers threads,
+    in the order they will be visited, so that on cloud paths (such as
+    cloudpathlib's S3Path, where every listing is a request) the round
+    trips overlap. Entries are yielded as soon as they are known, and
+    stopping the iteration cancels the listings still pending.
+
+    Parameters
+    -----------
+    path : pathlib.Path or cloudpath
+    max_depth : do not descend below this depth (None for no limit)
+    pattern : glob pattern entry names must match to be yielded;
+        directories that do not match are still searched
+    max_workers : number of concurrent listings; 1 lists serially
+    manifest : optional manifest.Manifest to take the listings from,
+        instead of listing path (no requests are made)
+    '''
+    if manifest is not None:
+        lister = partial(_manifest_scan, manifest)
+        max_workers = 1 # the manifest is local, and its connection is not shared across threads
     else:
-        pass
+        lister = _scan
+    pool = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+
+    def scan(p, depth):
+        nonlocal pool
+        if max_depth is not None and depth >= max_depth:
+            return _Deferred(lambda: None)
+        if pool is not None:
+            try:
+                return pool.submit(lister, p)
+            except RuntimeError: # no threads, e.g. in the browser
+                pool = None
+        return _Deferred(lister, p)
+
+    stack = [(0, path, scan(path, 0))]
+    try:
+        while stack:
+            depth, p, listing = stack.pop()
+            if pattern is None or fnmatch(p.name, pattern):
+                yield depth, p
+            children = listing.result()
+            if children:
+                pending = [(depth + 1, child, scan(child, depth + 1)) for child in children]
+                stack.extend(reversed(pending))
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def crawl(path, indent=0, max_depth=None, pattern=None, max_workers=8, manifest=None):
+    "Prints a nested tree of the contents of the given path (see walk for the options)."
+    for depth, subpath in walk(path, max_depth=max_depth, pattern=pattern,
+                               max_workers=max_workers, manifest=manifest):
+        print((' '*(indent + 3*depth)) + subpath.name)
 
 
 def load_aws_credentials(profile_name):
@@ -0,0 +1,66 @@
+"""Tests of the shared, read-only dataset and of the models built on it."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import synthetic
+from dataset import Dataset
+from models import BehavModel
+
+
+MEASURES = ['PicSeq_AgeAdj', 'CardSort_AgeAdj', 'FS_Total_GM_Vol']
+COLUMNS = ['Subject', 'Age', 'Gender'] + MEASURES
+
+
+@pytest.fixture
+def data():
+    return Dataset(synthetic.behavioural_frame(n_rows=50, n_columns=20))
+
+
+def test_columns_are_read_only(data):
+    values = data.column('PicSeq_AgeAdj')
+    assert np.shares_memory(values, data.frame['PicSeq_AgeAdj'].to_numpy())
+    with pytest.raises(ValueError):
+        values[0] = 0
+
+
+@pytest.mark.parametrize('dropna', [False, True])
+def test_projection_stays_read_only_after_a_selection(data, dropna):
+    original = data.frame[MEASURES].copy()
+    projection = data.project(COLUMNS, dropna=dropna)
+    projection[MEASURES].to_numpy() # consolidates this DataFrame into a private copy
+    projection.iloc[0, 3] = 5
+
+    later = data.project(COLUMNS, dropna=dropna)
+    assert later is not projection
+    with pytest.raises(ValueError):
+        later.iloc[0, 3] = 5
+    assert later.iloc[0, 3] != 5
+    assert data.frame[MEASURES].equals(original)
+
+
+def test_models_do_not_consolidate_the_projection(data):
+    projection = data.project(COLUMNS)
+    model = BehavModel(projection, MEASURES)
+    assert model.values.shape == (len(data), len(MEASURES))
+    with pytest.raises(ValueError):
+        projection.iloc[0, 3] = 5
+
+
+def test_dropna(data):
+    projection = data.project(MEASURES, dropna=True)
+    assert len(projection) == data.frame[MEASURES].notna().all(axis=1).sum()
+    assert not projection.isna().any().any()
+
+
+def test_released(data):
+    data.release()
+    with pytest.raises(ValueError):
+        len(data)
+    with pytest.raises(ValueError):
+        data.project(MEASURES)
@@ -0,0 +1,78 @@
+"""Tests of FileLoader's parsing paths and of how it reports failures."""
+import asyncio
+import datetime
+import sys
+from pathlib import Path
+
+import ipywidgets as widgets
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import synthetic
+from classes import FileLoader, Observer
+
+
+class Failing(Observer):
+    '''Observer whose update raises.'''
+
+    columns = {'Subject': None, 'Age': 'category'}
+
+    def _build_widgets(self):
+        return widgets.Label()
+
+    def _update_app(self):
+        pass
+
+    def update(self, data):
+        raise RuntimeError('observer failed')
+
+
+def _upload(loader, name, content):
+    loader._uploader.value = ({'name': name, 'content': memoryview(content), 'type': 'text/csv',
+                               'size': len(content), 'last_modified': datetime.datetime.now()},)
+
+
+@pytest.fixture
+def content():
+    return synthetic.behavioural_frame(n_rows=300, n_columns=20).to_csv(index=False).encode()
+
+
+def _load(loader, content, mode, monkeypatch):
+    if mode == 'sync':
+        _upload(loader, 'b.csv', content)
+        return
+    if mode == 'emscripten':
+        monkeypatch.setattr(sys, 'platform', 'emscripten')
+
+    async def main():
+        _upload(loader, 'b.csv', content)
+        for _ in range(1000):
+            if not loader._status.value.startswith('Loading'):
+                return
+            await asyncio.sleep(0.01)
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('mode', ['sync', 'thread', 'emscripten'])
+def test_observer_error_is_reported(content, mode, monkeypatch):
+    loader = FileLoader()
+    loader.chunksize = 100
+    Failing(loader).container
+    _load(loader, content, mode, monkeypatch)
+    assert loader._status.value == 'Could not load b.csv: observer failed'
+    assert loader._progress.layout.visibility == 'hidden'
+    assert loader._loaded is None
+
+
+@pytest.mark.parametrize('mode', ['sync', 'thread', 'emscripten'])
+def test_parse_error_is_reported(content, mode, monkeypatch):
+    loader = FileLoader()
+    loader.chunksize = 100
+    half = len(content) // 2
+    _load(loader, content[:half] + b'\xff\xfe\n' + content[half:], mode, monkeypatch)
+    assert loader._status.value.startswith('Could not load b.csv: ')
+    assert loader._progress.layout.visibility == 'hidden'
+    assert loader._loaded is None
+    assert loader.data is None
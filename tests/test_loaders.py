@@ -0,0 +1,53 @@
+"""Tests of CSV loading through the columnar cache."""
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import loaders
+
+
+CONTENT = b'a;b;c\n1;2;3\n4;5;6\n7;8;9\n'
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return tmp_path / 'cache'
+
+
+def test_read_csv_arguments_are_part_of_the_key(cache_dir):
+    assert list(loaders.read_csv_cached(CONTENT, cache_dir=cache_dir).columns) == ['a;b;c']
+    assert list(loaders.read_csv_cached(CONTENT, cache_dir=cache_dir, sep=';').columns) == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('source', ['path', 'url', 'bytes_io', 'string_io', 'gzip'])
+def test_sources_of_read_csv(tmp_path, cache_dir, source):
+    path = tmp_path / 'table.csv'
+    path.write_bytes(CONTENT)
+    if source == 'path':
+        source = path
+    elif source == 'url':
+        source = path.as_uri()
+    elif source == 'bytes_io':
+        source = io.BytesIO(CONTENT)
+    elif source == 'string_io':
+        source = io.StringIO(CONTENT.decode())
+    else:
+        source = tmp_path / 'table.csv.gz'
+        pd.read_csv(path, sep=';').to_csv(source, sep=';', index=False)
+
+    df = loaders.read_csv_cached(source, columns={'a': 'float32', 'c': None}, cache_dir=cache_dir, sep=';')
+    assert list(df.columns) == ['a', 'c']
+    assert df['a'].dtype == 'float32'
+    assert df['c'].tolist() == [3, 6, 9]
+
+
+def test_chunks_of_a_file_like_object(cache_dir):
+    chunks = list(loaders.iter_csv_cached(io.BytesIO(CONTENT), cache_dir=cache_dir, chunksize=2, sep=';'))
+    assert [(len(chunk), done) for chunk, done in chunks] == [(2, 0.0), (1, 1.0)]
+    assert not cache_dir.exists()
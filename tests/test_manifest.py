@@ -0,0 +1,124 @@
+"""Tests of the manifest index and of listing through it, on a synthetic tree."""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import synthetic
+from manifest import Manifest
+from utilities import ls, walk
+
+
+N_SUBJECTS = 3
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'bucket'
+    subjects = synthetic.write_profiles(root, N_SUBJECTS)
+    return root, subjects
+
+
+@pytest.fixture
+def manifest(tmp_path, tree):
+    root, _ = tree
+    with Manifest(tmp_path / 'manifest.sqlite') as manifest:
+        manifest.refresh(root)
+        yield manifest
+
+
+def _profiles(root, sub):
+    return root / f'sub-{sub}' / 'ses-01' / synthetic.PROFILES_NAME.format(sub=sub)
+
+
+def test_refresh_counts(tmp_path, tree):
+    root, subjects = tree
+    with Manifest(tmp_path / 'manifest.sqlite') as manifest:
+        assert manifest.refresh(root) == {'added': 2 * N_SUBJECTS, 'changed': 0, 'removed': 0}
+        assert len(manifest) == 2 * N_SUBJECTS
+        assert manifest.refresh(root) == {'added': 0, 'changed': 0, 'removed': 0}
+
+        changed = _profiles(root, subjects[0])
+        changed.write_text(changed.read_text() + '\n')
+        stat = changed.stat()
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        _profiles(root, subjects[1]).unlink()
+        assert manifest.refresh(root) == {'added': 0, 'changed': 1, 'removed': 1}
+        assert len(manifest) == 2 * N_SUBJECTS - 1
+
+
+def test_refresh_prefix_only_touches_prefix(tmp_path, tree):
+    root, subjects = tree
+    with Manifest(tmp_path / 'manifest.sqlite') as manifest:
+        manifest.refresh(root)
+        _profiles(root, subjects[0]).unlink()
+        _profiles(root, subjects[1]).unlink()
+        assert manifest.refresh(root, prefix=f'sub-{subjects[0]}/') == {'added': 0, 'changed': 0, 'removed': 1}
+        assert len(manifest) == 2 * N_SUBJECTS - 1
+
+
+def test_refresh_other_base_url(tmp_path, manifest):
+    with pytest.raises(ValueError):
+        manifest.refresh(tmp_path / 'elsewhere')
+
+
+def test_queries(tree, manifest):
+    root, subjects = tree
+    assert manifest.subjects_with('profiles') == subjects
+    assert manifest.subjects_with('sl_count', subject=subjects[:2]) == subjects[:2]
+    assert manifest.subjects_with('viz') == []
+
+    profiles = sum(_profiles(root, sub).stat().st_size for sub in subjects)
+    assert manifest.total_size(derivative='profiles') == profiles
+    assert manifest.total_size() == sum(p.stat().st_size for p in root.rglob('*') if p.is_file())
+    assert manifest.total_size(subject='none') == 0
+
+    key = _profiles(root, subjects[0]).relative_to(root).as_posix()
+    assert key in manifest
+    assert manifest.keys(subject=subjects[0], derivative='profiles') == [key]
+
+
+def test_listdir(tree, manifest):
+    root, subjects = tree
+    assert manifest.listdir('') == ([f'sub-{sub}' for sub in subjects], [])
+    assert manifest.listdir(f'sub-{subjects[0]}') == (['ses-01'], [])
+    dirs, files = manifest.listdir(f'sub-{subjects[0]}/ses-01/')
+    assert dirs == []
+    assert files == sorted(name.format(sub=subjects[0])
+                           for name in (synthetic.PROFILES_NAME, synthetic.SL_COUNT_NAME))
+    assert manifest.listdir('sub-none') == ([], [])
+
+
+def test_key_of(tmp_path, tree, manifest):
+    root, subjects = tree
+    assert manifest.key_of(root) == ''
+    assert manifest.key_of(root / f'sub-{subjects[0]}') == f'sub-{subjects[0]}'
+    path = _profiles(root, subjects[0])
+    assert manifest.key_of(path) == path.relative_to(root).as_posix()
+    assert manifest.key_of(str(root) + f'/sub-{subjects[0]}/') == f'sub-{subjects[0]}'
+    with pytest.raises(ValueError):
+        manifest.key_of(tmp_path / 'elsewhere')
+
+
+def test_key_of_empty_manifest(tmp_path):
+    with Manifest(tmp_path / 'manifest.sqlite') as manifest:
+        with pytest.raises(ValueError):
+            manifest.key_of(tmp_path)
+
+
+def test_ls_and_walk_match_the_file_system(tree, manifest):
+    root, subjects = tree
+    session = root / f'sub-{subjects[0]}' / 'ses-01'
+    assert ls(root, manifest=manifest) == ls(root)
+    assert ls(session, pattern='*_profiles.csv', manifest=manifest) == [_profiles(root, subjects[0])]
+    with pytest.raises(ValueError):
+        ls(_profiles(root, subjects[0]), manifest=manifest)
+
+    assert list(walk(root, manifest=manifest)) == list(walk(root, max_workers=1))
+    assert list(walk(root, max_depth=2, manifest=manifest)) == list(walk(root, max_depth=2, max_workers=1))
+    assert ([p for _, p in walk(root, pattern='*_sl_count.csv', manifest=manifest)]
+            == [root / f'sub-{sub}' / 'ses-01' / synthetic.SL_COUNT_NAME.format(sub=sub) for sub in subjects])
@@ -0,0 +1,45 @@
+"""Tests of the plot models and of the level-of-detail reduction they use."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import synthetic
+from lod import reduce_points
+from models import IndicatorModel
+
+
+def test_reduce_points_rejects_unequal_lengths():
+    with pytest.raises(ValueError):
+        reduce_points(np.zeros(10), np.zeros(9))
+
+
+def test_reduce_points_above_threshold():
+    x = np.arange(100.0)
+    view = reduce_points(x, -x, threshold=50, sample=20)
+    assert len(view['x']) == len(view['y']) == 20
+    np.testing.assert_array_equal(view['y'], -view['x'])
+    assert view['density'][2].sum() == 100
+
+
+def test_indicators_pair_by_country_and_year():
+    frame = pd.DataFrame({'Country Name': ['A', 'A', 'B', 'B', 'A', 'C'],
+                          'Indicator Name': ['x', 'y', 'y', 'x', 'x', 'y'],
+                          'Year': [2000, 2000, 2000, 2000, 2001, 2001],
+                          'Value': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]})
+    points = IndicatorModel(frame).render('x', 'y', (1990, 2010))['points']
+    assert sorted(zip(points['x'], points['y'])) == [(1.0, 2.0), (4.0, 3.0)]
+
+
+def test_indicators_above_threshold():
+    frame = synthetic.indicators_frame(n_rows=200000, n_indicators=2)
+    model = IndicatorModel(frame)
+    view = model.render('Indicator 0', 'Indicator 1', model.years, threshold=20000)
+    assert view['points']['density'] is not None
+    assert len(view['points']['x']) == len(view['points']['y'])
+    assert view['points']['density'][2].sum() > 20000
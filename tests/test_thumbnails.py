@@ -0,0 +1,46 @@
+"""Tests of the bundle thumbnails and of how TractPlot shows them."""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'content'))
+
+import synthetic
+import thumbnails
+from classes import TractPlot
+
+
+@pytest.fixture
+def images(tmp_path):
+    images = {}
+    for tract in ['ARC_L', 'ARC_R', 'CST_L']:
+        images[tract] = tmp_path / f'sub-1_dwi_{tract}_viz.gif'
+        images[tract].write_bytes(b'GIF89a' + tract.encode())
+    return images
+
+
+def test_unreadable_images_are_not_shown(images, monkeypatch):
+    images['ARC_R'].unlink()
+    def make_thumbnail(data, size):
+        if data.endswith(b'CST_L'):
+            raise OSError('cannot identify image file')
+        return data
+    monkeypatch.setattr(thumbnails, 'make_thumbnail', make_thumbnail)
+
+    plot = TractPlot(synthetic.profiles_frame(), images=images)
+    plot.container
+    shown = {}
+    for tract in ['ARC_L', 'ARC_R', 'CST_L', 'ARC_L']:
+        plot._tract_dropdown.value = tract
+        shown[tract] = plot._image.layout.display != 'none'
+    assert shown == {'ARC_L': True, 'ARC_R': False, 'CST_L': False}
+    assert plot._image.value == b'GIF89aARC_L'
+
+
+def test_images_without_thumbnail_are_not_cached(tmp_path, images):
+    cache = thumbnails.Thumbnails(images, cache_dir=tmp_path / 'cache')
+    assert cache.get('ARC_L') == b'GIF89aARC_L' # smaller than a thumbnail, or no Pillow
+    assert cache.get('nope') is None
+    assert not (tmp_path / 'cache').exists()